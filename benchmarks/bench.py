@@ -0,0 +1,467 @@
+"""
+GIF 转换与缓存管线的基准测试。
+
+用 Pillow 生成不同尺寸/帧数的合成 GIF（不访问网络），分别测量：
+- converter：MoviePy 转换（_blocking_gif_to_mp4）、FFmpeg 转换（_ffmpeg_gif_to_mp4）、
+  从视频抽帧（_generate_preview_frames）与直接从 GIF 抽帧（_sample_gif_frames）的耗时；
+- pipeline：用替身 AstrBot 对象与本地 HTTP 服务驱动完整的 handle_gif_message，
+  在不同并发下测量冷启动（全部未命中）与重复请求（缓存命中）的延迟分位数、吞吐与缓存命中情况。
+结果以 JSON 输出，便于比较不同引擎与配置。
+
+用法：
+    python benchmarks/bench.py --suite all --sizes small,medium --concurrency 1,4 \\
+        --config '{"conversion_engine": "ffmpeg"}' --output results.json
+"""
+
+import argparse
+import asyncio
+import contextlib
+import functools
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from aiohttp import web
+from PIL import Image, ImageDraw
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+import stubs
+
+# 在模块顶层加载插件：spawn 方式启动的转换进程同样会执行这里，从而能找到插件包
+main = stubs.install()
+converter = sys.modules[f"{stubs.PLUGIN_PACKAGE}.converter"]
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# 名称 -> (宽, 高, 帧数)
+GIF_SIZES = {
+    "small": (120, 90, 12),
+    "medium": (320, 240, 48),
+    "large": (640, 480, 120),
+}
+FRAME_DELAY_MS = 60
+
+
+def make_gif(path: Path, width: int, height: int, frame_count: int, seed: int):
+    """生成带移动色块与噪点的 GIF，seed 不同则内容不同。"""
+    rng = random.Random(seed)
+    frames = []
+    blocks = [
+        (rng.randrange(width), rng.randrange(height), rng.randrange(8, 40))
+        for _ in range(6)
+    ]
+    for i in range(frame_count):
+        image = Image.new("RGB", (width, height), (seed % 256, 40, 90))
+        draw = ImageDraw.Draw(image)
+        for j, (x, y, size) in enumerate(blocks):
+            dx = (x + i * (j + 1) * 3) % width
+            dy = (y + i * (j + 2) * 2) % height
+            draw.rectangle(
+                [dx, dy, dx + size, dy + size],
+                fill=((j * 40 + i * 5) % 256, (seed * 7 + j * 30) % 256, 200),
+            )
+        for _ in range(width * height // 200):
+            draw.point(
+                (rng.randrange(width), rng.randrange(height)),
+                fill=(rng.randrange(256),) * 3,
+            )
+        frames.append(image)
+    frames[0].save(
+        path, save_all=True, append_images=frames[1:], duration=FRAME_DELAY_MS, loop=0
+    )
+
+
+def percentiles(values: list[float]) -> dict:
+    """延迟统计（毫秒）。分位数按线性插值计算。"""
+    if not values:
+        return {}
+    ordered = sorted(values)
+
+    def _at(q: float) -> float:
+        pos = (len(ordered) - 1) * q
+        low = int(pos)
+        high = min(low + 1, len(ordered) - 1)
+        return ordered[low] + (ordered[high] - ordered[low]) * (pos - low)
+
+    return {
+        "count": len(ordered),
+        "mean_ms": sum(ordered) / len(ordered) * 1000,
+        "p50_ms": _at(0.5) * 1000,
+        "p90_ms": _at(0.9) * 1000,
+        "p99_ms": _at(0.99) * 1000,
+        "max_ms": ordered[-1] * 1000,
+    }
+
+
+def peak_rss_mb() -> dict:
+    """本进程与已结束子进程（如 FFmpeg）的峰值常驻内存（MB）。"""
+    if resource is None:
+        return {}
+    # Linux 上 ru_maxrss 单位为 KB，macOS 上为字节
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return {
+        "self": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale,
+        "children": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale,
+    }
+
+
+def environment() -> dict:
+    info = {
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+    ffmpeg = shutil.which("ffmpeg")
+    if ffmpeg:
+        output = subprocess.run(
+            [ffmpeg, "-version"], capture_output=True, text=True, check=False
+        ).stdout
+        info["ffmpeg"] = output.split("\n", 1)[0]
+    for package in ("moviepy", "PIL", "numpy", "aiohttp"):
+        try:
+            info[package] = __import__(package).__version__
+        except Exception:
+            info[package] = None
+    return info
+
+
+def _timed(func, *args, **kwargs) -> float:
+    start = time.perf_counter()
+    func(*args, **kwargs)
+    return time.perf_counter() - start
+
+
+async def _timed_async(factory) -> float:
+    start = time.perf_counter()
+    await factory()
+    return time.perf_counter() - start
+
+
+def bench_converter(work_dir: Path, sizes: list[str], iterations: int) -> list[dict]:
+    """直接调用转换函数，测量各引擎与抽帧方式的单次耗时。"""
+    work_dir.mkdir(parents=True, exist_ok=True)
+    results = []
+    frame_options = dict(converter.DEFAULT_FRAME_OPTIONS)
+    ffmpeg = shutil.which("ffmpeg")
+    for size in sizes:
+        width, height, frame_count = GIF_SIZES[size]
+        gif_path = work_dir / f"converter_{size}.gif"
+        make_gif(gif_path, width, height, frame_count, seed=1)
+        gif_info = converter._read_gif_info(str(gif_path))
+        frame_indices = converter._sample_frame_indices(
+            gif_info["durations"], frame_options["count"]
+        )
+        source_fps = 1000 / min(gif_info["durations"])
+        cases = {"moviepy": [], "ffmpeg": [], "frames_video": [], "frames_gif": []}
+        for i in range(iterations):
+            out_dir = work_dir / f"converter_{size}_{i}"
+            out_dir.mkdir()
+            mp4_path = out_dir / "moviepy.mp4"
+            cases["moviepy"].append(
+                _timed(
+                    converter._blocking_gif_to_mp4,
+                    str(gif_path),
+                    str(mp4_path),
+                    str(out_dir / "moviepy_frames"),
+                    "bench",
+                    frame_options,
+                )
+            )
+            if ffmpeg:
+                cases["ffmpeg"].append(
+                    asyncio.run(
+                        _timed_async(
+                            functools.partial(
+                                converter._ffmpeg_gif_to_mp4,
+                                str(gif_path),
+                                str(out_dir / "ffmpeg.mp4"),
+                                ffmpeg,
+                                None,
+                                str(out_dir / "ffmpeg_frames"),
+                                "bench",
+                                frame_indices,
+                                frame_options,
+                                None,
+                                source_fps,
+                            )
+                        )
+                    )
+                )
+            cases["frames_video"].append(
+                _timed(
+                    converter._generate_preview_frames,
+                    str(mp4_path),
+                    str(out_dir / "video_frames"),
+                    "bench",
+                    frame_options,
+                )
+            )
+            cases["frames_gif"].append(
+                _timed(
+                    converter._sample_gif_frames,
+                    str(gif_path),
+                    str(out_dir / "gif_frames"),
+                    "bench",
+                    frame_options,
+                )
+            )
+        for case, timings in cases.items():
+            if timings:
+                results.append(
+                    {
+                        "suite": "converter",
+                        "case": case,
+                        "size": size,
+                        "gif_bytes": gif_path.stat().st_size,
+                        "latency": percentiles(timings),
+                    }
+                )
+        results.append(
+            {"suite": "converter", "case": "peak_rss", "size": size, **peak_rss_mb()}
+        )
+    return results
+
+
+async def _serve_gifs(gif_dir: Path) -> tuple[web.AppRunner, int]:
+    """本地 HTTP 服务，替代真实的图片下载地址。"""
+
+    async def handle(request: web.Request) -> web.FileResponse:
+        return web.FileResponse(gif_dir / request.match_info["name"])
+
+    app = web.Application()
+    app.router.add_get("/{name}", handle)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, port
+
+
+def _counter_delta(before: dict, after: dict) -> dict:
+    return {
+        name: value - before.get(name, 0)
+        for name, value in after.items()
+        if value != before.get(name, 0)
+    }
+
+
+async def _run_phase(plugin, urls: list[str], concurrency: int) -> dict:
+    """以给定并发发送一批各含一张 GIF 的消息，返回延迟、吞吐与缓存计数的变化。"""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: list[float] = []
+    failures = 0
+
+    async def _one(url: str):
+        nonlocal failures
+        async with semaphore:
+            event = stubs.AstrMessageEvent([stubs.Image(file="bench", url=url)])
+            request = stubs.ProviderRequest("看看[图片]")
+            start = time.perf_counter()
+            await plugin.handle_gif_message(event, request)
+            latencies.append(time.perf_counter() - start)
+            if not request.image_urls:
+                failures += 1
+
+    before = plugin._metrics.snapshot()["counters"]
+    start = time.perf_counter()
+    await asyncio.gather(*(_one(url) for url in urls))
+    elapsed = time.perf_counter() - start
+    after = plugin._metrics.snapshot()["counters"]
+    return {
+        "requests": len(urls),
+        "failures": failures,
+        "throughput_rps": len(urls) / elapsed if elapsed else 0.0,
+        "latency": percentiles(latencies),
+        "counters": _counter_delta(before, after),
+    }
+
+
+async def bench_pipeline(
+    work_dir: Path,
+    sizes: list[str],
+    concurrency_levels: list[int],
+    requests_per_phase: int,
+    config: dict,
+) -> list[dict]:
+    """驱动完整的 handle_gif_message：冷启动、重复请求（别名+热点缓存）与换 URL 的相同内容。"""
+    gif_dir = work_dir / "served"
+    gif_dir.mkdir(parents=True)
+    runner, port = await _serve_gifs(gif_dir)
+    stubs.DATA_ROOT = work_dir / "data"
+    plugin_config = {"enabled_provider_id": stubs.BENCH_PROVIDER_ID, **config}
+    plugin = main.GifToVideoPlugin(stubs.Context(), stubs.AstrBotConfig(plugin_config))
+    await plugin.initialize()
+    results = []
+    try:
+        seed = 1000
+        for size in sizes:
+            width, height, frame_count = GIF_SIZES[size]
+            for concurrency in concurrency_levels:
+                names = []
+                for _ in range(requests_per_phase):
+                    seed += 1
+                    name = f"{size}_{seed}.gif"
+                    await asyncio.to_thread(
+                        make_gif, gif_dir / name, width, height, frame_count, seed
+                    )
+                    names.append(name)
+                base = f"http://127.0.0.1:{port}"
+                phases = {
+                    "cold": [f"{base}/{name}" for name in names],
+                    "repeat": [f"{base}/{name}" for name in names],
+                    # 不同 URL 的相同内容：需要下载，但按内容摘要命中缓存
+                    "same_content": [f"{base}/{name}?v=2" for name in names],
+                }
+                for phase, urls in phases.items():
+                    result = await _run_phase(plugin, urls, concurrency)
+                    results.append(
+                        {
+                            "suite": "pipeline",
+                            "case": phase,
+                            "size": size,
+                            "concurrency": concurrency,
+                            **result,
+                            "peak_rss_mb": peak_rss_mb(),
+                        }
+                    )
+        results.append(
+            {
+                "suite": "pipeline",
+                "case": "totals",
+                "stages": plugin._metrics.snapshot()["stages"],
+                "scheduler": plugin._scheduler.snapshot(),
+                "cache": plugin._cache.stats(),
+                "hot_cache": plugin._hot_cache.stats(),
+            }
+        )
+    finally:
+        await plugin.terminate()
+        await runner.cleanup()
+    return results
+
+
+def _summary_line(result: dict) -> str | None:
+    latency = result.get("latency")
+    if not latency:
+        return None
+    parts = [
+        f"{result['suite']:<9}",
+        f"{result['case']:<13}",
+        f"{result.get('size', ''):<7}",
+    ]
+    if "concurrency" in result:
+        parts.append(f"c={result['concurrency']:<3}")
+        parts.append(f"{result['throughput_rps']:8.1f} req/s")
+    parts.append(
+        f"p50 {latency['p50_ms']:8.1f}ms  p90 {latency['p90_ms']:8.1f}ms  "
+        f"p99 {latency['p99_ms']:8.1f}ms"
+    )
+    return "  ".join(parts)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="GIF 转换与缓存管线基准测试")
+    parser.add_argument(
+        "--suite", choices=["converter", "pipeline", "all"], default="all"
+    )
+    parser.add_argument(
+        "--sizes",
+        default="small,medium",
+        help=f"逗号分隔的 GIF 规格：{', '.join(GIF_SIZES)}",
+    )
+    parser.add_argument(
+        "--iterations", type=int, default=5, help="converter 每种情况的重复次数"
+    )
+    parser.add_argument(
+        "--concurrency", default="1,4", help="pipeline 逗号分隔的并发数"
+    )
+    parser.add_argument(
+        "--requests", type=int, default=8, help="pipeline 每个阶段的请求数"
+    )
+    parser.add_argument(
+        "--config", default="{}", help="传给插件的 JSON 配置（覆盖默认值）"
+    )
+    parser.add_argument("--output", help="结果 JSON 文件路径，默认输出到标准输出")
+    parser.add_argument("--keep", action="store_true", help="保留生成的 GIF 与缓存目录")
+    return parser.parse_args(argv)
+
+
+@contextlib.contextmanager
+def _stdout_to_stderr():
+    """
+    将标准输出（包括转换进程继承的文件描述符）临时指向标准错误，
+    MoviePy 的进度输出不会混入标准输出中的 JSON 结果。
+    """
+    sys.stdout.flush()
+    saved = os.dup(1)
+    os.dup2(2, 1)
+    try:
+        yield
+    finally:
+        sys.stdout.flush()
+        os.dup2(saved, 1)
+        os.close(saved)
+
+
+def _run_suites(args, work_dir, sizes, concurrency_levels, config) -> list[dict]:
+    results = []
+    if args.suite in ("converter", "all"):
+        results += bench_converter(work_dir / "converter", sizes, args.iterations)
+    if args.suite in ("pipeline", "all"):
+        results += asyncio.run(
+            bench_pipeline(
+                work_dir / "pipeline", sizes, concurrency_levels, args.requests, config
+            )
+        )
+    return results
+
+
+def main_cli(argv=None):
+    args = parse_args(argv)
+    sizes = [size.strip() for size in args.sizes.split(",") if size.strip()]
+    unknown = [size for size in sizes if size not in GIF_SIZES]
+    if unknown:
+        raise SystemExit(f"未知的 GIF 规格: {', '.join(unknown)}")
+    concurrency_levels = [int(level) for level in args.concurrency.split(",")]
+    config = json.loads(args.config)
+
+    work_dir = Path(tempfile.mkdtemp(prefix="gif2video_bench_"))
+    results = []
+    try:
+        with _stdout_to_stderr():
+            results += _run_suites(args, work_dir, sizes, concurrency_levels, config)
+    finally:
+        if args.keep:
+            print(f"工作目录: {work_dir}", file=sys.stderr)
+        else:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    report = {
+        "environment": environment(),
+        "arguments": vars(args),
+        "results": results,
+    }
+    for result in results:
+        line = _summary_line(result)
+        if line:
+            print(line, file=sys.stderr)
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        Path(args.output).write_text(text + "\n", encoding="utf-8")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,162 @@
+"""
+基准测试使用的最小 AstrBot 替身。
+
+只提供插件用到的接口（配置、日志、Star、消息组件、事件装饰器），
+让基准测试无需完整的 AstrBot 运行环境即可加载插件并驱动 handle_gif_message。
+"""
+
+import importlib
+import logging
+import sys
+import types
+from pathlib import Path
+from typing import ClassVar
+
+PLUGIN_PACKAGE = "astrbot_plugin_gif_to_video"
+PLUGIN_ROOT = Path(__file__).resolve().parent.parent
+
+# 插件数据目录的根，由基准测试在每次运行前设置
+DATA_ROOT = Path("bench_data")
+BENCH_PROVIDER_ID = "bench"
+
+
+class AstrBotConfig(dict):
+    def save_config(self):
+        pass
+
+
+class Context:
+    """替身上下文：只有一个服务商，ID 为 BENCH_PROVIDER_ID。"""
+
+    def __init__(self):
+        self.provider = Provider()
+        self.provider_manager = types.SimpleNamespace(
+            inst_map={BENCH_PROVIDER_ID: self.provider}
+        )
+
+    def get_using_provider(self, umo=None):
+        return self.provider
+
+    def get_all_providers(self):
+        return [self.provider]
+
+
+class Provider:
+    provider_config: ClassVar[dict] = {
+        "id": BENCH_PROVIDER_ID,
+        "type": "openai_chat_completion",
+    }
+
+    def meta(self):
+        return types.SimpleNamespace(
+            id=BENCH_PROVIDER_ID, type="openai_chat_completion", model="bench"
+        )
+
+
+class Star:
+    def __init__(self, context):
+        self.context = context
+
+
+class StarTools:
+    @staticmethod
+    def get_data_dir(name: str) -> Path:
+        path = DATA_ROOT / name
+        path.mkdir(parents=True, exist_ok=True)
+        return path
+
+
+def register(*args, **kwargs):
+    return lambda cls: cls
+
+
+class _Names:
+    """枚举替身：任意属性都返回其名称。"""
+
+    def __getattr__(self, name):
+        return name
+
+
+class _Filter:
+    """事件装饰器替身：所有装饰器都原样返回被装饰的函数。"""
+
+    PermissionType = _Names()
+    EventMessageType = _Names()
+
+    def __getattr__(self, name):
+        def decorator_factory(*args, **kwargs):
+            def decorator(func):
+                # 兼容指令组：@group.command(...) 形式的子指令
+                func.command = decorator_factory
+                return func
+
+            return decorator
+
+        return decorator_factory
+
+
+class AstrMessageEvent:
+    def __init__(self, components: list, umo: str = "bench:group:1"):
+        self.message_obj = types.SimpleNamespace(message=list(components))
+        self.unified_msg_origin = umo
+
+    def get_messages(self):
+        return self.message_obj.message
+
+    def plain_result(self, text: str):
+        return text
+
+
+class ProviderRequest:
+    def __init__(self, prompt: str, provider_id: str = BENCH_PROVIDER_ID):
+        self.prompt = prompt
+        self.image_urls: list[str] = []
+        self.provider_id = provider_id
+
+
+class Image:
+    def __init__(self, file: str | None = None, url: str | None = None):
+        self.file = file
+        self.url = url
+
+
+class Plain:
+    def __init__(self, text: str):
+        self.text = text
+
+
+def install():
+    """将替身模块注册为 astrbot.api，并返回加载好的插件 main 模块。"""
+    api = types.ModuleType("astrbot.api")
+    api.AstrBotConfig = AstrBotConfig
+    api.logger = logging.getLogger("astrbot")
+    event = types.ModuleType("astrbot.api.event")
+    event.filter = _Filter()
+    event.AstrMessageEvent = AstrMessageEvent
+    star = types.ModuleType("astrbot.api.star")
+    star.Context = Context
+    star.Star = Star
+    star.StarTools = StarTools
+    star.register = register
+    components = types.ModuleType("astrbot.api.message_components")
+    components.Image = Image
+    components.Plain = Plain
+    api.event, api.star, api.message_components = event, star, components
+    root = types.ModuleType("astrbot")
+    root.api = api
+    sys.modules.update(
+        {
+            "astrbot": root,
+            "astrbot.api": api,
+            "astrbot.api.event": event,
+            "astrbot.api.star": star,
+            "astrbot.api.message_components": components,
+        }
+    )
+
+    # 插件根目录没有 __init__.py，手动建立包以支持模块间的相对导入
+    if PLUGIN_PACKAGE not in sys.modules:
+        package = types.ModuleType(PLUGIN_PACKAGE)
+        package.__path__ = [str(PLUGIN_ROOT)]
+        sys.modules[PLUGIN_PACKAGE] = package
+    return importlib.import_module(f"{PLUGIN_PACKAGE}.main")
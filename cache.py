@@ -0,0 +1,911 @@
+import asyncio
+import contextlib
+import errno
+import hashlib
+import heapq
+import io
+import json
+import logging
+import os
+import re
+import shutil
+import socket
+import sqlite3
+import tarfile
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:  # Windows 没有 fcntl：跨实例锁退化为不加锁，原子发布仍保证结果完整
+    fcntl = None
+
+logger = logging.getLogger("astrbot")
+
+PLUGIN_NAME = "astrbot_plugin_gif_to_video"
+
+# 缓存条目类型
+KIND_VIDEO = "video"
+KIND_FRAMES = "frames"
+KIND_SOURCE = "source"
+KIND_SHEET = "sheet"
+
+# 编码输出先写入缓存根目录下的暂存区，完成后原子地发布到缓存路径
+STAGING_DIR_NAME = ".staging"
+# 帧目录完整写入后才会带有该标记，读取方据此忽略未完成的目录
+FRAMES_COMPLETE_MARKER = ".complete"
+# 超过该时长的暂存目录视为崩溃遗留，启动时清理
+STAGING_STALE_SECONDS = 3600
+# 共享缓存目录中的跨实例锁文件，按键哈希分片，锁文件数量固定且无需删除
+LOCK_DIR_NAME = ".locks"
+LOCK_STRIPES = 1024
+LOCK_POLL_INTERVAL = 0.2
+# 缓存导出包中的清单文件名与格式版本
+BUNDLE_MANIFEST = "manifest.json"
+BUNDLE_VERSION = 1
+# 缓存键由内容摘要与参数摘要组成（十六进制，以下划线连接）
+CACHE_KEY_PATTERN = re.compile(r"[0-9a-f]+(?:_[0-9a-f]+)*")
+# 缓存包中允许的网格图扩展名
+SHEET_EXTENSIONS = ("jpg", "png", "webp")
+
+
+def _tmp_name(path: Path) -> Path:
+    """同目录下的临时文件名。带主机名与进程号，多个实例共享缓存目录时也不会冲突。"""
+    return path.with_name(f".{path.name}.{socket.gethostname()}.{os.getpid()}.tmp")
+
+
+def _path_size(path: Path) -> int:
+    """文件大小，或目录下所有文件大小之和。"""
+    try:
+        if path.is_dir():
+            return sum(f.stat().st_size for f in path.iterdir() if f.is_file())
+        return path.stat().st_size
+    except FileNotFoundError:
+        return 0
+
+
+def _remove_path(path: Path):
+    if path.is_dir():
+        shutil.rmtree(path, ignore_errors=True)
+    else:
+        path.unlink(missing_ok=True)
+
+
+def publish_file(src: Path, dst: Path, keep_source: bool = False) -> Path:
+    """
+    将暂存文件原子地发布到缓存路径。同一文件系统内直接 rename，不复制数据；
+    跨文件系统或需要保留源文件（keep_source，如用户的本地文件）时，
+    先复制到目标目录下的临时文件，再原子替换。
+    """
+    if not keep_source:
+        try:
+            os.replace(src, dst)
+            return dst
+        except OSError as e:
+            if e.errno != errno.EXDEV:
+                raise
+    tmp_path = _tmp_name(dst)
+    try:
+        shutil.copy2(src, tmp_path)
+        os.replace(tmp_path, dst)
+    finally:
+        tmp_path.unlink(missing_ok=True)
+    if not keep_source:
+        src.unlink(missing_ok=True)
+    return dst
+
+
+def publish_dir(src: Path, dst: Path) -> Path:
+    """
+    写入完成标记后将暂存的帧目录整体发布。目标已是完整目录时保留现有结果，
+    未完成的旧目录（没有标记）会被替换。
+    """
+    (src / FRAMES_COMPLETE_MARKER).touch()
+    if is_complete_frame_dir(dst):
+        shutil.rmtree(src, ignore_errors=True)
+        return dst
+    if dst.exists():
+        shutil.rmtree(dst, ignore_errors=True)
+    try:
+        os.replace(src, dst)
+    except OSError as e:
+        if is_complete_frame_dir(dst):
+            # 并发发布时另一方已先完成
+            shutil.rmtree(src, ignore_errors=True)
+            return dst
+        if e.errno != errno.EXDEV:
+            raise
+        tmp_dir = _tmp_name(dst)
+        shutil.copytree(src, tmp_dir, dirs_exist_ok=True)
+        shutil.rmtree(src, ignore_errors=True)
+        os.replace(tmp_dir, dst)
+    return dst
+
+
+def is_complete_frame_dir(path: Path) -> bool:
+    return (path / FRAMES_COMPLETE_MARKER).exists()
+
+
+def _bundle_entry_path(key, kind, rel_hint) -> str | None:
+    """
+    按 (key, kind) 重建条目在缓存目录中的相对路径，不信任清单中记录的路径；
+    清单路径只用于确定网格图的扩展名。键或类型不合法时返回 None。
+    """
+    if not isinstance(key, str) or not CACHE_KEY_PATTERN.fullmatch(key):
+        return None
+    if kind == KIND_VIDEO:
+        return f"{key}.mp4"
+    if kind == KIND_SOURCE:
+        return f"{key}.gif"
+    if kind == KIND_FRAMES:
+        return f"frames/{key}"
+    if kind == KIND_SHEET:
+        extension = str(rel_hint).rpartition(".")[2]
+        if extension in SHEET_EXTENSIONS:
+            return f"sheets/{key}.{extension}"
+    return None
+
+
+def _bundle_members(
+    members: list[tarfile.TarInfo], arcname: str, is_dir: bool
+) -> list[tarfile.TarInfo] | None:
+    """
+    选出条目对应的包成员：文件条目只取同名成员，帧目录只取其下一层的文件。
+    成员名为绝对路径或含 .. 时返回 None，整条跳过。
+    """
+    selected = []
+    for member in members:
+        name = member.name
+        if is_dir:
+            if not name.startswith(f"{arcname}/"):
+                continue
+            child = name[len(arcname) + 1 :]
+            if not child or "/" in child or child == "..":
+                return None
+        elif name != arcname:
+            continue
+        if name.startswith("/") or ".." in name.split("/"):
+            return None
+        selected.append(member)
+    return selected
+
+
+def _open_lock_file(lock_path: Path) -> int:
+    lock_path.parent.mkdir(parents=True, exist_ok=True)
+    return os.open(lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+
+
+def _try_lock(fd: int) -> bool:
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return True
+    except BlockingIOError:
+        return False
+
+
+class CacheManager:
+    """
+    带持久化索引的缓存管理器。
+    - SQLite 索引记录每个条目的路径、大小、命中次数与最后访问时间，启动时载入内存。
+    - 命中只更新内存中的统计，批量写回数据库，热路径不做目录扫描。
+    - 超出总容量预算或过期时，在后台按 LRU/LFU 分批淘汰。
+    - 共享模式：多个实例共用同一缓存目录（如 NFS），索引仍各自保存在本地；
+      其他实例发布的文件在首次访问时登记（adopt），转换前通过锁文件避免重复编码。
+      每个实例只淘汰自己写入（或导入）的条目，登记的他人条目只读，容量预算也只计算自己的条目。
+    """
+
+    # 淘汰到预算的 90% 为止，避免每次新增都触发淘汰
+    LOW_WATERMARK = 0.9
+    EVICTION_BATCH = 64
+    # 最近被访问的条目可能正在被发送给 LLM，短时间内不淘汰
+    EVICTION_GRACE_SECONDS = 60
+    FLUSH_THRESHOLD = 256
+    MAINTENANCE_INTERVAL = 300
+
+    def __init__(
+        self,
+        cache_dir: Path,
+        max_bytes: int = 0,
+        ttl: float = 0,
+        policy: str = "lru",
+        index_dir: Path | None = None,
+        shared: bool = False,
+    ):
+        self.cache_dir = cache_dir
+        self.max_bytes = max(0, int(max_bytes))
+        self.ttl = max(0.0, float(ttl))
+        self.policy = policy if policy in ("lru", "lfu") else "lru"
+        # SQLite 不适合放在网络文件系统上，共享模式下索引保存在 index_dir（本地）
+        self.db_path = (index_dir or cache_dir) / "index.sqlite3"
+        self.staging_dir = cache_dir / STAGING_DIR_NAME
+        self.shared = shared
+        self.lock_dir = cache_dir / LOCK_DIR_NAME
+        self.total_bytes = 0
+        # 本实例负责淘汰的条目总大小；非共享模式下与 total_bytes 相同
+        self.owned_bytes = 0
+        self.added_bytes = 0
+        self.evictions = 0
+        # (key, kind) -> [path, size, hits, created, last_access, owned]
+        self._entries: dict[tuple[str, str], list] = {}
+        # source_key -> (cache_key, updated)
+        self._aliases: dict[str, tuple[str, float]] = {}
+        # cache_key -> (GIF 探测结果, updated)
+        self._probes: dict[str, tuple[dict, float]] = {}
+        self._dirty: set[tuple[str, str]] = set()
+        self._lock = threading.RLock()
+        self._db: sqlite3.Connection | None = None
+        self._eviction_task: asyncio.Task | None = None
+        self._maintenance_task: asyncio.Task | None = None
+        # 新增与命中大多发生在工作线程中（asyncio.to_thread），
+        # 淘汰与写回经由 start_maintenance 时记录的事件循环调度
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._eviction_retry: asyncio.TimerHandle | None = None
+        self._evict_listeners = []
+
+    def open(self):
+        """打开索引数据库并载入内存。首次创建索引时登记已有的缓存文件。"""
+        is_new = not self.db_path.exists()
+        self._db = sqlite3.connect(
+            str(self.db_path), check_same_thread=False, isolation_level=None
+        )
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            "key TEXT NOT NULL, kind TEXT NOT NULL, path TEXT NOT NULL, "
+            "size INTEGER NOT NULL, hits INTEGER NOT NULL DEFAULT 0, "
+            "created REAL NOT NULL, last_access REAL NOT NULL, "
+            "PRIMARY KEY (key, kind))"
+        )
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(entries)")}
+        if "owned" not in columns:
+            self._db.execute(
+                "ALTER TABLE entries ADD COLUMN owned INTEGER NOT NULL DEFAULT 1"
+            )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS aliases ("
+            "source_key TEXT PRIMARY KEY, cache_key TEXT NOT NULL, "
+            "updated REAL NOT NULL)"
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS probes ("
+            "key TEXT PRIMARY KEY, info TEXT NOT NULL, updated REAL NOT NULL)"
+        )
+        with self._lock:
+            for row in self._db.execute(
+                "SELECT key, kind, path, size, hits, created, last_access, owned "
+                "FROM entries"
+            ):
+                key, kind, path, size, hits, created, last_access, owned = row
+                self._entries[(key, kind)] = [
+                    path,
+                    size,
+                    hits,
+                    created,
+                    last_access,
+                    bool(owned),
+                ]
+            for source_key, cache_key, updated in self._db.execute(
+                "SELECT source_key, cache_key, updated FROM aliases"
+            ):
+                self._aliases[source_key] = (cache_key, updated)
+            for key, info, updated in self._db.execute(
+                "SELECT key, info, updated FROM probes"
+            ):
+                self._probes[key] = (json.loads(info), updated)
+            self.total_bytes = sum(entry[1] for entry in self._entries.values())
+            self.owned_bytes = sum(
+                entry[1] for entry in self._entries.values() if entry[5]
+            )
+
+        if is_new:
+            self._register_existing_files()
+        self._cleanup_staging()
+
+    def _cleanup_staging(self):
+        """清理崩溃或强制退出后遗留的暂存目录。"""
+        self.staging_dir.mkdir(parents=True, exist_ok=True)
+        expire_before = time.time() - STAGING_STALE_SECONDS
+        for path in self.staging_dir.iterdir():
+            try:
+                if path.stat().st_mtime < expire_before:
+                    _remove_path(path)
+            except OSError:
+                continue
+
+    def make_staging_dir(self, prefix: str = "convert_") -> Path:
+        """在缓存所在文件系统上创建暂存目录，输出完成后可直接 rename 发布。"""
+        return Path(tempfile.mkdtemp(prefix=prefix, dir=self.staging_dir))
+
+    def _register_existing_files(self):
+        """
+        旧版本遗留的缓存文件没有索引，首次启动时登记一次。
+        共享模式下目录中的文件可能属于其他实例，只登记不负责淘汰。
+        """
+        now = time.time()
+        owned = not self.shared
+        for path in self.cache_dir.glob("*.mp4"):
+            self._add(path.stem, KIND_VIDEO, path, now, owned=owned)
+        for path in self.cache_dir.glob("*.gif"):
+            self._add(path.stem, KIND_SOURCE, path, now, owned=owned)
+        for path in self.cache_dir.glob("sheets/*"):
+            self._add(path.stem, KIND_SHEET, path, now, owned=owned)
+        frame_root = self.cache_dir / "frames"
+        if frame_root.is_dir():
+            for path in frame_root.iterdir():
+                if path.is_dir():
+                    self._add(path.name, KIND_FRAMES, path, now, owned=owned)
+
+    def add_evict_listener(self, callback):
+        """注册淘汰回调 callback(key, kind)，用于同步失效上层缓存。"""
+        self._evict_listeners.append(callback)
+
+    def flush(self):
+        """将内存中累计的命中统计写回数据库。"""
+        with self._lock:
+            if not self._dirty or self._db is None:
+                return
+            rows = [
+                (entry[2], entry[4], key, kind)
+                for key, kind in self._dirty
+                if (entry := self._entries.get((key, kind)))
+            ]
+            self._dirty.clear()
+            self._db.executemany(
+                "UPDATE entries SET hits = ?, last_access = ? WHERE key = ? AND kind = ?",
+                rows,
+            )
+
+    async def close(self):
+        for task in (self._eviction_task, self._maintenance_task):
+            if task and not task.done():
+                task.cancel()
+        if self._eviction_retry is not None:
+            self._eviction_retry.cancel()
+        self._loop = None
+        await asyncio.to_thread(self._close)
+
+    def _close(self):
+        self.flush()
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    def lookup_alias(self, source_key: str) -> str | None:
+        alias = self._aliases.get(source_key)
+        if alias and (not self.ttl or time.time() - alias[1] <= self.ttl):
+            return alias[0]
+        return None
+
+    def put_alias(self, source_key: str, cache_key: str):
+        now = time.time()
+        with self._lock:
+            self._aliases[source_key] = (cache_key, now)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO aliases (source_key, cache_key, updated) "
+                    "VALUES (?, ?, ?)",
+                    (source_key, cache_key, now),
+                )
+
+    def get_probe(self, key: str) -> dict | None:
+        """返回缓存的 GIF 探测结果（帧数、尺寸、时长、文件大小）。"""
+        probe = self._probes.get(key)
+        return probe[0] if probe else None
+
+    def put_probe(self, key: str, info: dict):
+        now = time.time()
+        with self._lock:
+            self._probes[key] = (info, now)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO probes (key, info, updated) "
+                    "VALUES (?, ?, ?)",
+                    (key, json.dumps(info), now),
+                )
+
+    def _prune_aliases(self):
+        if not self.ttl:
+            return
+        expire_before = time.time() - self.ttl
+        with self._lock:
+            expired = [
+                source_key
+                for source_key, (_, updated) in self._aliases.items()
+                if updated < expire_before
+            ]
+            for source_key in expired:
+                del self._aliases[source_key]
+            expired_probes = [
+                key
+                for key, (_, updated) in self._probes.items()
+                if updated < expire_before
+            ]
+            for key in expired_probes:
+                del self._probes[key]
+            if self._db is not None:
+                self._db.execute(
+                    "DELETE FROM aliases WHERE updated < ?", (expire_before,)
+                )
+                self._db.execute(
+                    "DELETE FROM probes WHERE updated < ?", (expire_before,)
+                )
+
+    def _is_expired(self, entry: list, now: float) -> bool:
+        return bool(self.ttl) and now - entry[3] > self.ttl
+
+    def adopt(self, key: str, kind: str, path: Path) -> Path | None:
+        """
+        登记其他实例已发布到共享缓存目录的文件，返回其路径。
+        登记的条目只读：由写入它的实例负责淘汰，本实例只会将其从索引中移除。
+        文件不存在、已过期或帧目录尚未写完时返回 None。
+        """
+        try:
+            created = path.stat().st_mtime
+        except OSError:
+            return None
+        if kind == KIND_FRAMES and not is_complete_frame_dir(path):
+            return None
+        if self.ttl and time.time() - created > self.ttl:
+            return None
+        self._add(key, kind, path, time.time(), created, owned=False)
+        return path
+
+    @contextlib.asynccontextmanager
+    async def lock(self, name: str, timeout: float):
+        """
+        跨实例的排他锁（共享缓存目录下的 flock 锁文件），用于避免多个实例重复转换同一内容。
+        等待超过 timeout 秒或平台不支持时不加锁继续执行，最坏只会重复转换一次。
+        """
+        if not self.shared or fcntl is None:
+            yield
+            return
+        stripe = int(hashlib.md5(name.encode()).hexdigest(), 16) % LOCK_STRIPES
+        lock_path = self.lock_dir / f"{stripe:03x}.lock"
+        fd = await asyncio.to_thread(_open_lock_file, lock_path)
+        locked = False
+        try:
+            deadline = time.monotonic() + timeout
+            while not (locked := await asyncio.to_thread(_try_lock, fd)):
+                if time.monotonic() >= deadline:
+                    logger.warning(
+                        f"[{PLUGIN_NAME}] 等待共享缓存锁超时，不加锁继续: {name}"
+                    )
+                    break
+                await asyncio.sleep(LOCK_POLL_INTERVAL)
+            yield
+        finally:
+            if locked:
+                await asyncio.to_thread(fcntl.flock, fd, fcntl.LOCK_UN)
+            await asyncio.to_thread(os.close, fd)
+
+    def get(self, key: str, kind: str) -> Path | None:
+        """查找缓存条目并记录一次命中。条目过期或文件已丢失时返回 None。"""
+        entry = self._entries.get((key, kind))
+        if entry is None:
+            return None
+        if self._is_expired(entry, time.time()):
+            return None
+        path = Path(entry[0])
+        if not path.exists():
+            self.remove(key, kind)
+            return None
+        self.touch(key, kind)
+        return path
+
+    def touch(self, key: str, kind: str):
+        """只在内存中记录一次命中（不访问文件系统），供上层热点缓存命中时调用。"""
+        with self._lock:
+            entry = self._entries.get((key, kind))
+            if entry is None:
+                return
+            entry[2] += 1
+            entry[4] = time.time()
+            self._dirty.add((key, kind))
+            should_flush = len(self._dirty) >= self.FLUSH_THRESHOLD
+        if should_flush:
+            self._schedule_flush()
+
+    def expires_at(self, key: str, kind: str) -> float:
+        """条目的过期时间戳，0 表示不过期。"""
+        entry = self._entries.get((key, kind))
+        if entry is None or not self.ttl:
+            return 0.0
+        return entry[3] + self.ttl
+
+    def contains(self, key: str, kind: str) -> bool:
+        entry = self._entries.get((key, kind))
+        return entry is not None and not self._is_expired(entry, time.time())
+
+    def add(self, key: str, kind: str, path: Path):
+        """登记新写入的缓存条目，必要时在后台触发淘汰。"""
+        self.added_bytes += self._add(key, kind, path, time.time())
+        if self._over_budget():
+            self._schedule_eviction()
+
+    def _add(
+        self,
+        key: str,
+        kind: str,
+        path: Path,
+        now: float,
+        created: float | None = None,
+        owned: bool = True,
+    ) -> int:
+        size = _path_size(path)
+        created = now if created is None else created
+        with self._lock:
+            old = self._entries.get((key, kind))
+            if old:
+                self.total_bytes -= old[1]
+                if old[5]:
+                    self.owned_bytes -= old[1]
+            hits = old[2] if old else 0
+            self._entries[(key, kind)] = [str(path), size, hits, created, now, owned]
+            self.total_bytes += size
+            if owned:
+                self.owned_bytes += size
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO entries "
+                    "(key, kind, path, size, hits, created, last_access, owned) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (key, kind, str(path), size, hits, created, now, int(owned)),
+                )
+        return size
+
+    def remove(self, key: str, kind: str) -> Path | None:
+        """从索引中移除条目，返回其路径（文件由调用方删除）。"""
+        with self._lock:
+            entry = self._entries.pop((key, kind), None)
+            self._dirty.discard((key, kind))
+            if entry is None:
+                return None
+            self.total_bytes -= entry[1]
+            if entry[5]:
+                self.owned_bytes -= entry[1]
+            if self._db is not None:
+                self._db.execute(
+                    "DELETE FROM entries WHERE key = ? AND kind = ?", (key, kind)
+                )
+        for callback in self._evict_listeners:
+            try:
+                callback(key, kind)
+            except Exception as e:
+                logger.warning(f"[{PLUGIN_NAME}] 缓存淘汰回调失败: {e}")
+        return Path(entry[0])
+
+    def _call_in_loop(self, callback):
+        """在事件循环线程中执行 callback；从工作线程调用时经由 call_soon_threadsafe 投递。"""
+        loop = self._loop
+        if loop is None or loop.is_closed():
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            callback()
+        else:
+            loop.call_soon_threadsafe(callback)
+
+    def _schedule_eviction(self):
+        self._call_in_loop(self._start_eviction)
+
+    def _start_eviction(self):
+        if self._eviction_task and not self._eviction_task.done():
+            return
+        self._eviction_task = self._loop.create_task(self._evict_until_within_budget())
+
+    def _schedule_flush(self):
+        self._call_in_loop(
+            lambda: self._loop.create_task(asyncio.to_thread(self.flush))
+        )
+
+    def _over_budget(self, ratio: float = 1.0) -> bool:
+        """本实例负责的条目是否超出容量预算的 ratio 倍。"""
+        return bool(self.max_bytes) and self.owned_bytes > self.max_bytes * ratio
+
+    def _select_victims(self, now: float, limit: int) -> list[tuple[str, str]]:
+        """
+        挑选待淘汰条目：优先返回过期条目（含登记的他人条目，只从索引中移除），
+        否则在本实例的条目中按 LRU/LFU 挑选。
+        """
+        with self._lock:
+            expired = [
+                item
+                for item, entry in self._entries.items()
+                if self._is_expired(entry, now)
+            ][:limit]
+            if expired or not self._over_budget(self.LOW_WATERMARK):
+                return expired
+            candidates = (
+                (item, entry)
+                for item, entry in self._entries.items()
+                if entry[5] and now - entry[4] > self.EVICTION_GRACE_SECONDS
+            )
+            lfu = self.policy == "lfu"
+
+            def order(pair):
+                entry = pair[1]
+                return (entry[2], entry[4]) if lfu else entry[4]
+
+            return [item for item, _ in heapq.nsmallest(limit, candidates, key=order)]
+
+    def _evict_batch(self) -> int:
+        victims = self._select_victims(time.time(), self.EVICTION_BATCH)
+        evicted = 0
+        for key, kind in victims:
+            entry = self._entries.get((key, kind))
+            if entry is None:
+                continue
+            expired = self._is_expired(entry, time.time())
+            if not expired and not self._over_budget(self.LOW_WATERMARK):
+                break
+            path = self.remove(key, kind)
+            # 其他实例的文件只从本地索引中移除，由写入它的实例删除
+            if path is not None and entry[5]:
+                _remove_path(path)
+            evicted += 1
+        self.evictions += evicted
+        return evicted
+
+    async def _evict_until_within_budget(self):
+        """
+        分批淘汰，每批之间让出事件循环。仍超出预算时（剩余条目都在访问保护期内），
+        保护期过后再次淘汰，超出预算的时间不超过 EVICTION_GRACE_SECONDS。
+        """
+        try:
+            while await asyncio.to_thread(self._evict_batch):
+                await asyncio.sleep(0)
+        except Exception as e:
+            logger.warning(f"[{PLUGIN_NAME}] 缓存淘汰失败: {e}")
+        if (
+            self._over_budget()
+            and self._loop is not None
+            and (self._eviction_retry is None or self._eviction_retry.cancelled())
+        ):
+            self._eviction_retry = self._loop.call_later(
+                self.EVICTION_GRACE_SECONDS, self._retry_eviction
+            )
+
+    def _retry_eviction(self):
+        self._eviction_retry = None
+        self._start_eviction()
+
+    async def run_maintenance(self):
+        """定期写回命中统计并清理过期/超额条目。"""
+        while True:
+            await asyncio.sleep(self.MAINTENANCE_INTERVAL)
+            try:
+                await asyncio.to_thread(self.flush)
+                await asyncio.to_thread(self._prune_aliases)
+                await self._evict_until_within_budget()
+            except Exception as e:
+                logger.warning(f"[{PLUGIN_NAME}] 缓存维护失败: {e}")
+
+    def start_maintenance(self):
+        self._loop = asyncio.get_running_loop()
+        if self._maintenance_task is None or self._maintenance_task.done():
+            self._maintenance_task = self._loop.create_task(self.run_maintenance())
+            self._schedule_eviction()
+
+    def export_bundle(self, bundle_path: Path) -> dict:
+        """
+        将缓存导出为 tar 包：清单（条目、别名、探测结果）+ 缓存文件。
+        只导出未过期且文件仍存在的条目；媒体文件本身已压缩，tar 包不再压缩。
+        """
+        self.flush()
+        now = time.time()
+        with self._lock:
+            entries = [
+                (key, kind, Path(entry[0]), entry[3])
+                for (key, kind), entry in self._entries.items()
+                if not self._is_expired(entry, now)
+            ]
+            aliases = dict(self._aliases)
+            probes = dict(self._probes)
+        manifest = {"version": BUNDLE_VERSION, "entries": []}
+        # 缓存键均以内容摘要开头（视频、帧、网格图键为 摘要_参数摘要）
+        exported = set()
+        bundle_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = _tmp_name(bundle_path)
+        try:
+            with tarfile.open(tmp_path, "w") as tar:
+                for key, kind, path, created in entries:
+                    try:
+                        rel_path = path.relative_to(self.cache_dir).as_posix()
+                    except ValueError:
+                        continue
+                    if not path.exists():
+                        continue
+                    tar.add(path, arcname=f"files/{rel_path}")
+                    manifest["entries"].append([key, kind, rel_path, created])
+                    exported.add(key.split("_")[0])
+                manifest["aliases"] = [
+                    [source_key, cache_key, updated]
+                    for source_key, (cache_key, updated) in aliases.items()
+                    if cache_key in exported
+                ]
+                manifest["probes"] = [
+                    [key, info, updated]
+                    for key, (info, updated) in probes.items()
+                    if key in exported
+                ]
+                data = json.dumps(manifest, ensure_ascii=False).encode()
+                info = tarfile.TarInfo(BUNDLE_MANIFEST)
+                info.size = len(data)
+                info.mtime = int(now)
+                tar.addfile(info, io.BytesIO(data))
+            os.replace(tmp_path, bundle_path)
+        finally:
+            tmp_path.unlink(missing_ok=True)
+        return {
+            "entries": len(manifest["entries"]),
+            "aliases": len(manifest["aliases"]),
+            "bytes": bundle_path.stat().st_size,
+        }
+
+    def import_bundle(self, bundle_path: Path) -> dict:
+        """
+        导入 export_bundle 生成的缓存包。文件先解压到暂存区再原子发布；
+        本地已有的条目、已过期的条目以及路径不安全的条目都会跳过。
+        """
+        imported = skipped = 0
+        now = time.time()
+        staging_dir = self.make_staging_dir("import_")
+        staging_root = staging_dir.resolve()
+        try:
+            with tarfile.open(bundle_path, "r") as tar:
+                manifest_file = tar.extractfile(BUNDLE_MANIFEST)
+                if manifest_file is None:
+                    raise ValueError("缓存包缺少清单文件")
+                manifest = json.load(manifest_file)
+                if manifest.get("version") != BUNDLE_VERSION:
+                    raise ValueError(f"不支持的缓存包版本: {manifest.get('version')}")
+                # 只解压普通文件，忽略链接与设备文件
+                members = [member for member in tar.getmembers() if member.isfile()]
+                for key, kind, rel_hint, created in manifest["entries"]:
+                    rel = _bundle_entry_path(key, kind, rel_hint)
+                    if (
+                        rel is None
+                        or not isinstance(created, (int, float))
+                        or self.contains(key, kind)
+                        or (self.ttl and now - created > self.ttl)
+                    ):
+                        skipped += 1
+                        continue
+                    arcname = f"files/{rel}"
+                    selected = _bundle_members(members, arcname, kind == KIND_FRAMES)
+                    targets = [
+                        (staging_dir / member.name).resolve()
+                        for member in selected or []
+                    ]
+                    if not selected or not all(
+                        target.is_relative_to(staging_root) for target in targets
+                    ):
+                        skipped += 1
+                        continue
+                    for member, target in zip(selected, targets):
+                        target.parent.mkdir(parents=True, exist_ok=True)
+                        with tar.extractfile(member) as src, open(target, "wb") as dst:
+                            shutil.copyfileobj(src, dst)
+                    path = self.cache_dir / rel
+                    path.parent.mkdir(parents=True, exist_ok=True)
+                    if kind == KIND_FRAMES:
+                        publish_dir(staging_dir / arcname, path)
+                    elif not path.exists():
+                        publish_file(staging_dir / arcname, path)
+                    self._add(key, kind, path, now, created)
+                    imported += 1
+
+            # 别名与探测结果中的缓存键之后会用于拼接缓存路径，同样校验格式
+            aliases = [
+                (source_key, cache_key, updated)
+                for source_key, cache_key, updated in manifest["aliases"]
+                if isinstance(cache_key, str) and CACHE_KEY_PATTERN.fullmatch(cache_key)
+            ]
+            probes = [
+                (key, info, updated)
+                for key, info, updated in manifest["probes"]
+                if isinstance(key, str) and CACHE_KEY_PATTERN.fullmatch(key)
+            ]
+            with self._lock:
+                for source_key, cache_key, updated in aliases:
+                    self._aliases.setdefault(source_key, (cache_key, updated))
+                for key, info, updated in probes:
+                    self._probes.setdefault(key, (info, updated))
+                if self._db is not None:
+                    self._db.executemany(
+                        "INSERT OR IGNORE INTO aliases (source_key, cache_key, updated) "
+                        "VALUES (?, ?, ?)",
+                        aliases,
+                    )
+                    self._db.executemany(
+                        "INSERT OR IGNORE INTO probes (key, info, updated) "
+                        "VALUES (?, ?, ?)",
+                        [
+                            (key, json.dumps(info), updated)
+                            for key, info, updated in probes
+                        ],
+                    )
+        finally:
+            shutil.rmtree(staging_dir, ignore_errors=True)
+        if self._over_budget():
+            self._schedule_eviction()
+        return {
+            "entries": imported,
+            "skipped": skipped,
+            "aliases": len(aliases),
+        }
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "aliases": len(self._aliases),
+            "probes": len(self._probes),
+            "total_bytes": self.total_bytes,
+            "owned_bytes": self.owned_bytes,
+            "added_bytes": self.added_bytes,
+            "max_bytes": self.max_bytes,
+            "evictions": self.evictions,
+            "policy": self.policy,
+        }
+
+
+class HotCache:
+    """
+    位于磁盘缓存之前的进程内热点缓存。
+    - 缓存键 -> 已解析的结果（视频路径、预览帧列表等），命中时不访问文件系统。
+    - 按 LRU 限制条目数；条目随磁盘缓存的有效期过期，磁盘缓存淘汰条目时经由回调同步失效。
+    """
+
+    def __init__(self, max_entries: int = 512):
+        self.max_entries = max(0, int(max_entries))
+        self.hits = 0
+        self.misses = 0
+        # (key, kind) -> (value, expires_at)
+        self._entries: OrderedDict[tuple[str, str], tuple[object, float]] = (
+            OrderedDict()
+        )
+        self._lock = threading.Lock()
+
+    def get(self, key: str, kind: str):
+        if not self.max_entries:
+            return None
+        with self._lock:
+            item = self._entries.get((key, kind))
+            if item is not None and item[1] and time.time() > item[1]:
+                del self._entries[(key, kind)]
+                item = None
+            if item is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end((key, kind))
+            self.hits += 1
+            return item[0]
+
+    def put(self, key: str, kind: str, value, expires_at: float = 0.0):
+        if not self.max_entries:
+            return
+        with self._lock:
+            self._entries[(key, kind)] = (value, expires_at)
+            self._entries.move_to_end((key, kind))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key: str, kind: str):
+        with self._lock:
+            self._entries.pop((key, kind), None)
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
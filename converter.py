@@ -0,0 +1,729 @@
+import asyncio
+import bisect
+import functools
+import logging
+import math
+import os
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from PIL import Image, ImageDraw, ImageFont, ImageSequence
+
+if TYPE_CHECKING:
+    import numpy as np
+
+# 本模块可能在独立的转换进程中被导入，因此不依赖 astrbot.api，
+# 直接使用与 AstrBot 同名的 logger。
+logger = logging.getLogger("astrbot")
+
+PLUGIN_NAME = "astrbot_plugin_gif_to_video"
+
+# 与 FFmpeg GIF 解复用器一致：延迟小于 20ms 的帧按 100ms 处理
+GIF_MIN_FRAME_DELAY = 20
+GIF_DEFAULT_FRAME_DELAY = 100
+
+# 预览帧选取方式：uniform 按时间均匀采样；scene 按画面变化挑选差异最大的帧
+FRAME_SELECTION_UNIFORM = "uniform"
+FRAME_SELECTION_SCENE = "scene"
+# 计算画面差异时使用的灰度缩略图边长
+FRAME_SIGNATURE_SIZE = 32
+# 拼图网格中各帧之间的间隔（像素）
+CONTACT_SHEET_GAP = 4
+
+# 预览帧输出格式：配置值 -> (文件扩展名, Pillow 格式名)
+FRAME_FORMATS = {
+    "png": ("png", "PNG"),
+    "jpeg": ("jpg", "JPEG"),
+    "webp": ("webp", "WEBP"),
+}
+# 预览帧参数：帧数、选取方式、场景阈值、输出格式、有损压缩质量、最大边长（0 为不缩放）
+DEFAULT_FRAME_OPTIONS = {
+    "count": 4,
+    "selection": FRAME_SELECTION_UNIFORM,
+    "scene_threshold": 0.03,
+    "format": "png",
+    "quality": 85,
+    "max_size": 0,
+}
+
+# MP4 编码参数：预设、CRF、码率（设置后取代 CRF）、最大宽高、帧率上限、最大时长（秒）、像素格式。
+# 0 或空值表示不限制。
+DEFAULT_VIDEO_PROFILE = {
+    "preset": "ultrafast",
+    "crf": 23,
+    "bitrate": "",
+    "max_width": 0,
+    "max_height": 0,
+    "max_fps": 0,
+    "max_duration": 0,
+    "pix_fmt": "yuv420p",
+}
+
+
+def _video_profile(video_profile: dict | None) -> dict:
+    profile = dict(DEFAULT_VIDEO_PROFILE)
+    profile.update(video_profile or {})
+    return profile
+
+
+@functools.cache
+def _video_file_clip():
+    """
+    延迟导入 MoviePy 的 VideoFileClip。MoviePy 会连带导入 numpy、imageio、proglog 等，
+    放到首次使用时导入，插件加载与热重载时无需承担这部分开销。
+    """
+    # 兼容不同版本的moviepy
+    try:
+        from moviepy.editor import VideoFileClip  # 旧版本兼容
+    except ImportError:
+        try:
+            from moviepy.video.io.VideoFileClip import VideoFileClip  # 新版本2.x
+        except ImportError:
+            from moviepy.video import VideoFileClip  # 备用方案
+    return VideoFileClip
+
+
+def _warm_up_worker():
+    """转换进程的初始化函数：提前导入 MoviePy/Pillow，避免首个任务承担导入开销。"""
+    _video_file_clip()
+    Image.init()
+    return True
+
+
+def _frame_options(frame_options: dict | None) -> dict:
+    options = dict(DEFAULT_FRAME_OPTIONS)
+    options.update(frame_options or {})
+    if options["format"] not in FRAME_FORMATS:
+        options["format"] = DEFAULT_FRAME_OPTIONS["format"]
+    return options
+
+
+def _frame_extension(frame_format: str) -> str:
+    return FRAME_FORMATS.get(frame_format, FRAME_FORMATS["png"])[0]
+
+
+def _preview_frame_name(cache_key: str, idx: int, extension: str = "png") -> str:
+    # 序号补零，保证按文件名排序即为帧顺序
+    return f"{cache_key}_frame_{idx:03d}.{extension}"
+
+
+def _save_image(image: Image.Image, path: Path, options: dict, max_size: int = 0):
+    """按预览帧参数缩放并编码保存图片。有损格式跳过无损 PNG 的高开销压缩。"""
+    image = image.convert("RGB")
+    if max_size > 0 and max(image.size) > max_size:
+        image.thumbnail((max_size, max_size), Image.BILINEAR)
+    pil_format = FRAME_FORMATS[options["format"]][1]
+    if pil_format == "PNG":
+        image.save(path, pil_format, compress_level=1)
+    else:
+        image.save(path, pil_format, quality=int(options["quality"]))
+
+
+def _save_preview_frame(image: Image.Image, frame_path: Path, options: dict):
+    _save_image(image, frame_path, options, int(options["max_size"]))
+
+
+def _skip_gif_sub_blocks(f):
+    while True:
+        size = f.read(1)
+        if not size or size[0] == 0:
+            return
+        f.seek(size[0], os.SEEK_CUR)
+
+
+def _read_gif_info(gif_path: str) -> dict:
+    """只读取 GIF 的头部与帧表（跳过图像数据），返回尺寸、帧数与逐帧延迟（毫秒）。"""
+    with open(gif_path, "rb") as f:
+        header = f.read(13)
+        if len(header) < 13 or header[:6] not in (b"GIF87a", b"GIF89a"):
+            raise ValueError("不是有效的 GIF 文件")
+        width = int.from_bytes(header[6:8], "little")
+        height = int.from_bytes(header[8:10], "little")
+        if header[10] & 0x80:
+            # 跳过全局调色板
+            f.seek(3 << ((header[10] & 0x07) + 1), os.SEEK_CUR)
+
+        durations: list[int] = []
+        pending_delay = None
+        while True:
+            block_type = f.read(1)
+            if not block_type or block_type == b";":
+                break
+            if block_type == b"!":
+                label = f.read(1)
+                if label == b"\xf9":
+                    # 图形控制扩展：记录下一帧的延迟
+                    block = f.read(f.read(1)[0])
+                    if len(block) >= 3:
+                        pending_delay = int.from_bytes(block[1:3], "little") * 10
+                _skip_gif_sub_blocks(f)
+            elif block_type == b",":
+                descriptor = f.read(9)
+                if len(descriptor) < 9:
+                    break
+                if descriptor[8] & 0x80:
+                    f.seek(3 << ((descriptor[8] & 0x07) + 1), os.SEEK_CUR)
+                f.read(1)  # LZW 最小码长
+                _skip_gif_sub_blocks(f)
+                delay = pending_delay or 0
+                if delay < GIF_MIN_FRAME_DELAY:
+                    delay = GIF_DEFAULT_FRAME_DELAY
+                durations.append(delay)
+                pending_delay = None
+            else:
+                # 数据损坏，保留已读取的帧信息
+                break
+
+    return {
+        "width": width,
+        "height": height,
+        "frame_count": len(durations),
+        "durations": durations,
+        "duration": sum(durations) / 1000,
+    }
+
+
+def _sample_frame_indices(durations: list[int], sample_count: int) -> list[int]:
+    """按时间均匀采样帧序号：取各时间段中点所在的帧，去重后保持顺序。"""
+    frame_count = len(durations)
+    if frame_count == 0:
+        return []
+    sample_count = max(1, sample_count)
+    starts = []
+    total = 0
+    for delay in durations:
+        starts.append(total)
+        total += delay
+
+    indices: list[int] = []
+    for idx in range(sample_count):
+        t = (idx + 0.5) / sample_count * total
+        frame_idx = min(bisect.bisect_right(starts, t) - 1, frame_count - 1)
+        if not indices or indices[-1] != frame_idx:
+            indices.append(max(frame_idx, 0))
+    return indices
+
+
+def _frame_signature(image: Image.Image) -> "np.ndarray":
+    """将帧缩小为灰度缩略图，作为画面差异比较的特征（取值 0~1）。"""
+    import numpy as np
+
+    thumb = image.convert("L").resize(
+        (FRAME_SIGNATURE_SIZE, FRAME_SIGNATURE_SIZE), Image.BILINEAR
+    )
+    return np.asarray(thumb, dtype=np.float32).ravel() / 255.0
+
+
+def _select_distinct_frames(
+    signatures: "np.ndarray", max_count: int, threshold: float
+) -> list[int]:
+    """
+    从帧特征中挑选差异最大的帧：从首帧开始，每次选取与已选帧最小差异最大的帧，
+    最小差异低于阈值（近似重复）时停止。返回按时间顺序排列的帧序号。
+    """
+    import numpy as np
+
+    frame_count = len(signatures)
+    if frame_count == 0:
+        return []
+    max_count = max(1, max_count)
+    selected = [0]
+    # 每帧与已选帧集合的最小平均绝对差
+    min_diff = np.abs(signatures - signatures[0]).mean(axis=1)
+    while len(selected) < min(max_count, frame_count):
+        candidate = int(min_diff.argmax())
+        if min_diff[candidate] < threshold:
+            break
+        selected.append(candidate)
+        min_diff = np.minimum(
+            min_diff, np.abs(signatures - signatures[candidate]).mean(axis=1)
+        )
+    return sorted(selected)
+
+
+def _select_keyframes(gif_path: str, max_count: int, threshold: float) -> list[int]:
+    """解码 GIF 的全部帧，按画面变化挑选最多 max_count 个关键帧序号。"""
+    with Image.open(gif_path) as image:
+        signatures = [
+            _frame_signature(frame) for frame in ImageSequence.Iterator(image)
+        ]
+    if not signatures:
+        return []
+    import numpy as np
+
+    return _select_distinct_frames(np.stack(signatures), max_count, threshold)
+
+
+def _pix_fmt_alignment(pix_fmt: str) -> tuple[int, int]:
+    """像素格式对宽、高的对齐要求：4:2:0 色度抽样要求宽高均为偶数，4:2:2 要求宽为偶数。"""
+    pix_fmt = str(pix_fmt).lower()
+    if "420" in pix_fmt or pix_fmt in ("nv12", "nv21"):
+        return 2, 2
+    if "422" in pix_fmt:
+        return 2, 1
+    return 1, 1
+
+
+def _limit_clip(clip, profile: dict):
+    """
+    按编码参数截断时长并缩小分辨率，兼容 MoviePy 1.x/2.x 的方法名。
+    宽高不满足像素格式的对齐要求时（如 yuv420p 下的奇数尺寸）裁掉多余的 1 像素，
+    否则 FFmpeg 会拒绝编码，只留下空文件。
+    """
+    max_duration = float(profile["max_duration"] or 0)
+    if max_duration > 0 and clip.duration and clip.duration > max_duration:
+        subclip = getattr(clip, "subclipped", None) or clip.subclip
+        clip = subclip(0, max_duration)
+    align_x, align_y = _pix_fmt_alignment(profile["pix_fmt"])
+    width, height = clip.size
+    scale = 1.0
+    if profile["max_width"] and width > profile["max_width"]:
+        scale = min(scale, profile["max_width"] / width)
+    if profile["max_height"] and height > profile["max_height"]:
+        scale = min(scale, profile["max_height"] / height)
+    if scale < 1.0:
+        resize = getattr(clip, "resized", None) or clip.resize
+        clip = resize(
+            (
+                max(align_x, int(width * scale) // align_x * align_x),
+                max(align_y, int(height * scale) // align_y * align_y),
+            )
+        )
+    elif width % align_x or height % align_y:
+        crop = getattr(clip, "cropped", None) or clip.crop
+        clip = crop(
+            x1=0,
+            y1=0,
+            width=max(align_x, width // align_x * align_x),
+            height=max(align_y, height // align_y * align_y),
+        )
+    return clip
+
+
+def _write_clip_mp4(clip, output_path: str, video_profile: dict | None = None):
+    profile = _video_profile(video_profile)
+    clip = _limit_clip(clip, profile)
+    # 对于某些 GIF，MoviePy 可能无法正确读取 fps，这里提供默认值 15。
+    fps = clip.fps if clip.fps is not None else 15
+    if profile["max_fps"]:
+        fps = min(fps, profile["max_fps"])
+    ffmpeg_params = ["-pix_fmt", profile["pix_fmt"]]
+    if not profile["bitrate"]:
+        ffmpeg_params += ["-crf", str(profile["crf"])]
+    options = {
+        "codec": "libx264",
+        "preset": profile["preset"],
+        "audio": False,
+        "fps": fps,
+        "bitrate": profile["bitrate"] or None,
+        "ffmpeg_params": ffmpeg_params,
+    }
+    try:
+        # 尝试使用新版本 MoviePy 的参数（不包含 verbose 和 logger）
+        clip.write_videofile(output_path, **options)
+    except TypeError as e:
+        if "verbose" in str(e):
+            # 如果仍然报错 verbose 参数问题，尝试使用旧版本参数
+            logger.warning(
+                f"[{PLUGIN_NAME}] MoviePy 版本兼容性问题，尝试使用旧参数: {e}"
+            )
+            clip.write_videofile(output_path, **options, verbose=False, logger=None)
+        else:
+            # 如果是其他参数错误，直接抛出
+            raise
+
+
+def _extract_clip_keyframes(
+    clip, frame_dir_path: Path, cache_key: str, options: dict
+) -> list[str]:
+    """两次遍历 clip：先计算逐帧特征挑选关键帧，再只保存选中的帧。"""
+    signatures = [
+        _frame_signature(Image.fromarray(frame)) for frame in clip.iter_frames()
+    ]
+    if not signatures:
+        return []
+    import numpy as np
+
+    wanted = {
+        frame_idx: idx
+        for idx, frame_idx in enumerate(
+            _select_distinct_frames(
+                np.stack(signatures), options["count"], options["scene_threshold"]
+            )
+        )
+    }
+    extension = _frame_extension(options["format"])
+    generated_frames: list[str] = []
+    for frame_idx, frame in enumerate(clip.iter_frames()):
+        if frame_idx in wanted:
+            frame_path = frame_dir_path / _preview_frame_name(
+                cache_key, wanted[frame_idx], extension
+            )
+            _save_preview_frame(Image.fromarray(frame), frame_path, options)
+            generated_frames.append(str(frame_path))
+        if len(generated_frames) == len(wanted):
+            break
+    return generated_frames
+
+
+def _extract_clip_frames(
+    clip, frame_dir: str, cache_key: str, frame_options: dict | None = None
+) -> list[str]:
+    """从已打开的 clip 中抽取预览帧（均匀采样或按画面变化挑选）。"""
+    options = _frame_options(frame_options)
+    frame_dir_path = Path(frame_dir)
+    frame_dir_path.mkdir(parents=True, exist_ok=True)
+    if options["selection"] == FRAME_SELECTION_SCENE:
+        return _extract_clip_keyframes(clip, frame_dir_path, cache_key, options)
+    extension = _frame_extension(options["format"])
+    generated_frames: list[str] = []
+
+    duration = clip.duration or 0
+    sample_count = max(1, options["count"])
+
+    for idx in range(sample_count):
+        if duration <= 0:
+            t = 0
+        else:
+            fraction = (idx + 0.5) / sample_count
+            t = min(max(fraction * duration, 0), max(duration - 0.01, 0))
+        try:
+            frame = clip.get_frame(t)
+        except Exception as frame_error:
+            logger.warning(f"[{PLUGIN_NAME}] 提取第 {idx} 帧失败: {frame_error}")
+            continue
+        frame_path = frame_dir_path / _preview_frame_name(cache_key, idx, extension)
+        _save_preview_frame(Image.fromarray(frame), frame_path, options)
+        generated_frames.append(str(frame_path))
+
+    if generated_frames:
+        # 更新目录时间戳，便于 TTL 计算
+        frame_dir_path.touch(exist_ok=True)
+    return generated_frames
+
+
+def _blocking_gif_to_mp4(
+    input_path: str,
+    output_path: str,
+    frame_dir: str | None = None,
+    cache_key: str | None = None,
+    frame_options: dict | None = None,
+    video_profile: dict | None = None,
+) -> list[str]:
+    """
+    使用 MoviePy 在独立线程/进程中执行转换。这里尽量减少控制台输出并关闭音频轨道。
+    指定 frame_dir 时，在同一次打开的 GIF 上先抽取预览帧再编码，避免再次解码输出的 MP4。
+    """
+    frames: list[str] = []
+    with _video_file_clip()(input_path) as clip:
+        if frame_dir and cache_key and frame_options:
+            frames = _extract_clip_frames(clip, frame_dir, cache_key, frame_options)
+        _write_clip_mp4(clip, output_path, video_profile)
+    return frames
+
+
+def _build_ffmpeg_gif_to_mp4_args(
+    input_path: str,
+    output_path: str,
+    ffmpeg_bin: str = "ffmpeg",
+    frame_dir: str | None = None,
+    cache_key: str | None = None,
+    frame_indices: list[int] | None = None,
+    frame_options: dict | None = None,
+    video_profile: dict | None = None,
+    source_fps: float | None = None,
+) -> list[str]:
+    """
+    构造 GIF -> MP4 的 FFmpeg 命令行；指定帧序号时同一次解码同时输出预览帧。
+    source_fps 为 GIF 的最高帧率，低于帧率上限时不插入 fps 滤镜，避免重复帧。
+    """
+    profile = _video_profile(video_profile)
+    video_filters = []
+    max_width, max_height = int(profile["max_width"]), int(profile["max_height"])
+    if max_width or max_height:
+        width_expr = f"min(iw,{max_width})" if max_width else "iw"
+        height_expr = f"min(ih,{max_height})" if max_height else "ih"
+        video_filters.append(
+            f"scale='{width_expr}':'{height_expr}':force_original_aspect_ratio=decrease"
+        )
+    max_fps = float(profile["max_fps"] or 0)
+    if max_fps > 0 and (source_fps is None or source_fps > max_fps):
+        video_filters.append(f"fps={max_fps:g}")
+    # H.264 + yuv420p 要求宽高为偶数
+    video_filters.append("scale=trunc(iw/2)*2:trunc(ih/2)*2")
+    video_filter = ",".join(video_filters)
+
+    rate_args = (
+        ["-b:v", str(profile["bitrate"])]
+        if profile["bitrate"]
+        else ["-crf", str(profile["crf"])]
+    )
+    max_duration = float(profile["max_duration"] or 0)
+    duration_args = ["-t", f"{max_duration:g}"] if max_duration > 0 else []
+    video_args = [
+        "-c:v",
+        "libx264",
+        "-preset",
+        str(profile["preset"]),
+        *rate_args,
+        "-pix_fmt",
+        str(profile["pix_fmt"]),
+        # 保留 GIF 每帧各自的延迟，而不是按固定帧率重复/丢弃帧
+        "-vsync",
+        "vfr",
+        # 时长限制只作用于视频输出，预览帧仍覆盖整段动画
+        *duration_args,
+        "-movflags",
+        "+faststart",
+        "-an",
+        output_path,
+    ]
+    args = [
+        ffmpeg_bin,
+        "-hide_banner",
+        "-loglevel",
+        "error",
+        "-nostdin",
+        "-y",
+        "-i",
+        input_path,
+    ]
+
+    if not (frame_dir and cache_key and frame_indices):
+        return [*args, "-vf", video_filter, *video_args]
+
+    options = _frame_options(frame_options)
+    frame_filters = [
+        "select='{}'".format("+".join(f"eq(n,{idx})" for idx in frame_indices))
+    ]
+    max_size = int(options["max_size"])
+    if max_size > 0:
+        frame_filters.append(
+            f"scale='min(iw,{max_size})':'min(ih,{max_size})'"
+            ":force_original_aspect_ratio=decrease"
+        )
+    extension = _ffmpeg_frame_extension(options["format"])
+    if extension == "jpg":
+        # 将 1~100 的质量映射到 MJPEG 的 -q:v（2 最好，31 最差）
+        quality = min(max(int(options["quality"]), 1), 100)
+        frame_filters.append("format=yuvj444p")
+        frame_codec_args = ["-q:v", str(round(2 + (100 - quality) * 29 / 100))]
+    else:
+        frame_filters.append("format=rgb24")
+        frame_codec_args = ["-compression_level", "1"]
+    filter_complex = (
+        f"[0:v]split=2[v][f];[v]{video_filter}[vout];[f]{','.join(frame_filters)}[fout]"
+    )
+    frame_pattern = str(Path(frame_dir) / f"{cache_key}_frame_%03d.{extension}")
+    return [
+        *args,
+        "-filter_complex",
+        filter_complex,
+        "-map",
+        "[vout]",
+        *video_args,
+        "-map",
+        "[fout]",
+        "-vsync",
+        "vfr",
+        *frame_codec_args,
+        "-start_number",
+        "0",
+        frame_pattern,
+    ]
+
+
+def _ffmpeg_frame_extension(frame_format: str) -> str:
+    """FFmpeg 单次解码直接输出的帧格式。WebP 依赖可选的 libwebp，先输出 PNG 再由 Pillow 转码。"""
+    return "jpg" if frame_format == "jpeg" else "png"
+
+
+def _recode_preview_frames(frame_paths: list[str], frame_options: dict) -> list[str]:
+    """将 FFmpeg 输出的 PNG 预览帧转码为配置的格式，返回新路径。"""
+    options = _frame_options(frame_options)
+    extension = _frame_extension(options["format"])
+    recoded: list[str] = []
+    for frame_path in map(Path, frame_paths):
+        target = frame_path.with_suffix(f".{extension}")
+        if target != frame_path:
+            with Image.open(frame_path) as image:
+                # FFmpeg 已按最大边长缩放
+                _save_image(image, target, options)
+            frame_path.unlink(missing_ok=True)
+        recoded.append(str(target))
+    return recoded
+
+
+async def _ffmpeg_gif_to_mp4(
+    input_path: str,
+    output_path: str,
+    ffmpeg_bin: str = "ffmpeg",
+    timeout: float | None = None,
+    frame_dir: str | None = None,
+    cache_key: str | None = None,
+    frame_indices: list[int] | None = None,
+    frame_options: dict | None = None,
+    video_profile: dict | None = None,
+    source_fps: float | None = None,
+) -> list[str]:
+    """
+    直接调用 FFmpeg 子进程完成转换，解码与编码均在 FFmpeg 内部完成，不经过 Python。
+    指定 frame_indices 时，在同一次解码中按帧序号输出预览帧，返回帧文件路径。
+    """
+    if frame_dir and frame_indices:
+        Path(frame_dir).mkdir(parents=True, exist_ok=True)
+    process = await asyncio.create_subprocess_exec(
+        *_build_ffmpeg_gif_to_mp4_args(
+            input_path,
+            output_path,
+            ffmpeg_bin,
+            frame_dir,
+            cache_key,
+            frame_indices,
+            frame_options,
+            video_profile,
+            source_fps,
+        ),
+        stdin=asyncio.subprocess.DEVNULL,
+        stdout=asyncio.subprocess.DEVNULL,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    try:
+        _, stderr = await asyncio.wait_for(process.communicate(), timeout)
+    except (TimeoutError, asyncio.CancelledError):
+        process.kill()
+        await process.wait()
+        raise
+    if process.returncode != 0:
+        message = stderr.decode("utf-8", errors="replace").strip()
+        raise RuntimeError(
+            f"FFmpeg 转换失败 (exit {process.returncode}): {message[-500:]}"
+        )
+
+    if not (frame_dir and cache_key and frame_indices):
+        return []
+    extension = _ffmpeg_frame_extension(_frame_options(frame_options)["format"])
+    frames = [
+        Path(frame_dir) / _preview_frame_name(cache_key, idx, extension)
+        for idx in range(len(frame_indices))
+    ]
+    return [str(frame) for frame in frames if frame.exists()]
+
+
+def _sample_gif_frames(
+    gif_path: str, frame_dir: str, cache_key: str, frame_options: dict | None = None
+) -> list[str]:
+    """
+    直接用 Pillow 从源 GIF 抽取预览帧，不经过视频编码。
+    默认按逐帧延迟均匀采样，只解码到最后一个需要的帧为止；scene 模式按画面变化挑选关键帧。
+    """
+    options = _frame_options(frame_options)
+    if options["selection"] == FRAME_SELECTION_SCENE:
+        frame_indices = _select_keyframes(
+            gif_path, options["count"], options["scene_threshold"]
+        )
+    else:
+        frame_indices = _sample_frame_indices(
+            _read_gif_info(gif_path)["durations"], options["count"]
+        )
+    frame_dir_path = Path(frame_dir)
+    frame_dir_path.mkdir(parents=True, exist_ok=True)
+    generated_frames: list[str] = []
+    if not frame_indices:
+        return generated_frames
+
+    extension = _frame_extension(options["format"])
+    wanted = {frame_idx: idx for idx, frame_idx in enumerate(frame_indices)}
+    with Image.open(gif_path) as image:
+        for frame_idx, frame in enumerate(ImageSequence.Iterator(image)):
+            if frame_idx in wanted:
+                frame_path = frame_dir_path / _preview_frame_name(
+                    cache_key, wanted[frame_idx], extension
+                )
+                _save_preview_frame(frame, frame_path, options)
+                generated_frames.append(str(frame_path))
+            if frame_idx >= frame_indices[-1]:
+                break
+
+    if generated_frames:
+        frame_dir_path.touch(exist_ok=True)
+    return generated_frames
+
+
+def _generate_preview_frames(
+    video_path: str, frame_dir: str, cache_key: str, frame_options: dict | None = None
+) -> list[str]:
+    """从视频中抽取预览帧，返回帧文件路径。失败时抛出异常，由调用方清理。"""
+    with _video_file_clip()(str(video_path)) as clip:
+        return _extract_clip_frames(clip, frame_dir, cache_key, frame_options)
+
+
+def _contact_sheet_layout(frame_count: int, columns: int = 0) -> tuple[int, int]:
+    """计算拼图网格的 (行数, 列数)。columns 为 0 时按接近正方形自动排列。"""
+    if frame_count <= 0:
+        return 0, 0
+    columns = columns if columns > 0 else math.ceil(math.sqrt(frame_count))
+    columns = min(columns, frame_count)
+    return math.ceil(frame_count / columns), columns
+
+
+def _build_contact_sheet(
+    frame_paths: list[str],
+    output_path: str,
+    columns: int = 0,
+    max_edge: int = 1536,
+    frame_options: dict | None = None,
+) -> tuple[int, int]:
+    """
+    将预览帧按时间顺序拼成一张网格图，并在每格左上角标注帧序号（从 1 开始）。
+    整张图的长边不超过 max_edge，返回 (行数, 列数)。
+    """
+    images = []
+    for frame_path in frame_paths:
+        with Image.open(frame_path) as image:
+            images.append(image.convert("RGB"))
+    rows, columns = _contact_sheet_layout(len(images), columns)
+    if not images:
+        raise ValueError("没有可拼接的预览帧")
+
+    tile_w = max(image.width for image in images)
+    tile_h = max(image.height for image in images)
+    full_w = columns * tile_w + (columns - 1) * CONTACT_SHEET_GAP
+    full_h = rows * tile_h + (rows - 1) * CONTACT_SHEET_GAP
+    scale = min(1.0, max_edge / max(full_w, full_h)) if max_edge > 0 else 1.0
+    tile_w = max(1, int(tile_w * scale))
+    tile_h = max(1, int(tile_h * scale))
+
+    sheet = Image.new(
+        "RGB",
+        (
+            columns * tile_w + (columns - 1) * CONTACT_SHEET_GAP,
+            rows * tile_h + (rows - 1) * CONTACT_SHEET_GAP,
+        ),
+        (255, 255, 255),
+    )
+    draw = ImageDraw.Draw(sheet)
+    font_size = max(12, tile_h // 8)
+    try:
+        font = ImageFont.load_default(size=font_size)
+    except TypeError:
+        # Pillow < 10.1 的默认字体不支持指定字号
+        font = ImageFont.load_default()
+
+    for idx, image in enumerate(images):
+        row, col = divmod(idx, columns)
+        x = col * (tile_w + CONTACT_SHEET_GAP)
+        y = row * (tile_h + CONTACT_SHEET_GAP)
+        image.thumbnail((tile_w, tile_h))
+        sheet.paste(
+            image, (x + (tile_w - image.width) // 2, y + (tile_h - image.height) // 2)
+        )
+        label = str(idx + 1)
+        left, top, right, bottom = draw.textbbox((0, 0), label, font=font)
+        draw.rectangle(
+            (x, y, x + right - left + 8, y + bottom - top + 6), fill=(0, 0, 0)
+        )
+        draw.text((x + 4 - left, y + 3 - top), label, fill=(255, 255, 255), font=font)
+
+    _save_image(sheet, Path(output_path), _frame_options(frame_options))
+    return rows, columns
@@ -0,0 +1,75 @@
+import os
+from urllib.parse import urlsplit
+
+# GIF 文件头（魔数），嗅探时只需读取这几个字节
+GIF_MAGIC = (b"GIF87a", b"GIF89a")
+GIF_MAGIC_SIZE = 6
+# 明确不是 GIF 的图片扩展名，命中时无需嗅探
+NON_GIF_EXTENSIONS = frozenset(
+    {
+        ".jpg",
+        ".jpeg",
+        ".jfif",
+        ".png",
+        ".webp",
+        ".bmp",
+        ".avif",
+        ".heic",
+        ".heif",
+        ".tif",
+        ".tiff",
+        ".ico",
+        ".svg",
+    }
+)
+
+
+def is_gif_header(data: bytes) -> bool:
+    return data[:GIF_MAGIC_SIZE] in GIF_MAGIC
+
+
+def is_remote_source(source: str) -> bool:
+    return source.startswith(("http://", "https://"))
+
+
+def image_source(url: str | None, file: str | None) -> str | None:
+    """
+    图片组件的读取来源：优先使用 http(s) URL，否则使用本地文件路径。
+    base64 等无法按源读取的图片返回 None。
+    """
+    for candidate in (url, file):
+        if candidate and is_remote_source(candidate):
+            return candidate
+    if file and not file.startswith("base64://"):
+        return file.removeprefix("file://")
+    return None
+
+
+def _name_extension(name: str) -> str:
+    path = urlsplit(name).path if is_remote_source(name) else name
+    return os.path.splitext(path)[1].lower()
+
+
+def guess_gif_by_name(*names: str | None) -> bool | None:
+    """
+    按文件名 / URL 快速判断是否为 GIF，不做任何 I/O。
+    返回 True（是 GIF）、False（明确不是 GIF）或 None（无法判断，需要嗅探文件头）。
+    """
+    extensions = [_name_extension(name) for name in names if name]
+    if ".gif" in extensions:
+        return True
+    if any(extension in NON_GIF_EXTENSIONS for extension in extensions):
+        return False
+    # 兼容旧的判断方式：扩展名不明确但名称中带有 .gif（如 CDN 查询参数）
+    if any(".gif" in name.lower() for name in names if name):
+        return True
+    return None
+
+
+def sniff_gif_file(path: str) -> bool:
+    """读取本地文件头判断是否为 GIF，文件不存在或不可读时视为非 GIF。"""
+    try:
+        with open(path, "rb") as f:
+            return is_gif_header(f.read(GIF_MAGIC_SIZE))
+    except OSError:
+        return False
@@ -1,60 +1,52 @@
 import asyncio
 import hashlib
+import os
 import shutil
-import tempfile
 import threading
 import time
 from pathlib import Path
 
 import aiohttp
-from PIL import Image
-
-# 兼容不同版本的moviepy
-try:
-    from moviepy.editor import VideoFileClip  # 旧版本兼容
-except ImportError:
-    try:
-        from moviepy.video.io.VideoFileClip import VideoFileClip  # 新版本2.x
-    except ImportError:
-        from moviepy.video import VideoFileClip  # 备用方案
 from astrbot.api import AstrBotConfig, logger
 from astrbot.api.event import filter, AstrMessageEvent
 from astrbot.api.star import Context, Star, StarTools, register
 import astrbot.api.message_components as Comp
 
-
-def _blocking_gif_to_mp4(input_path: str, output_path: str):
-    # 使用 MoviePy 在独立线程中执行转换。这里尽量减少控制台输出并关闭音频轨道。
-    # 对于某些 GIF，MoviePy 可能无法正确读取 fps，这里提供默认值 15。
-    with VideoFileClip(input_path) as clip:
-        fps = clip.fps if clip.fps is not None else 15
-        try:
-            # 尝试使用新版本 MoviePy 的参数（不包含 verbose 和 logger）
-            clip.write_videofile(
-                output_path,
-                codec="libx264",
-                preset="ultrafast",
-                audio=False,
-                fps=fps,
-            )
-        except TypeError as e:
-            if "verbose" in str(e):
-                # 如果仍然报错 verbose 参数问题，尝试使用旧版本参数
-                logger.warning(
-                    f"[astrbot_plugin_gif_to_video] MoviePy 版本兼容性问题，尝试使用旧参数: {e}"
-                )
-                clip.write_videofile(
-                    output_path,
-                    codec="libx264",
-                    preset="ultrafast",
-                    audio=False,
-                    fps=fps,
-                    verbose=False,
-                    logger=None,
-                )
-            else:
-                # 如果是其他参数错误，直接抛出
-                raise
+from .cache import (
+    KIND_FRAMES,
+    KIND_SHEET,
+    KIND_SOURCE,
+    KIND_VIDEO,
+    CacheManager,
+    HotCache,
+    is_complete_frame_dir,
+    publish_dir,
+    publish_file,
+)
+from .converter import (
+    _blocking_gif_to_mp4,
+    _build_contact_sheet,
+    _contact_sheet_layout,
+    _frame_extension,
+    _ffmpeg_gif_to_mp4,
+    _generate_preview_frames,
+    _read_gif_info,
+    _recode_preview_frames,
+    _sample_frame_indices,
+    _sample_gif_frames,
+    _select_keyframes,
+    _warm_up_worker,
+)
+from .detect import (
+    GIF_MAGIC_SIZE,
+    guess_gif_by_name,
+    image_source,
+    is_gif_header,
+    is_remote_source,
+    sniff_gif_file,
+)
+from .metrics import Metrics, write_prometheus_file
+from .scheduler import ConversionScheduler, SchedulerSaturatedError
 
 
 @register(
@@ -73,46 +65,285 @@ class GifToVideoPlugin(Star):
     """
 
     PLUGIN_NAME = "astrbot_plugin_gif_to_video"
+    VIDEO_MARKER = "[视频(GIF已转换)]"
+    FRAMES_MARKER = "[动图(GIF已拆帧)]"
+    # 探测后的处理路径：完整转换 / 只抽预览帧 / 单帧静态图
+    ROUTE_VIDEO = "video"
+    ROUTE_FRAMES = "frames"
+    ROUTE_STATIC = "static"
+    # 共享缓存目录下，热点缓存条目最多保留该秒数，其他实例淘汰文件后能尽快失效
+    SHARED_HOT_CACHE_TTL = 60
+    # 遇到路由表中没有的服务商时重建路由表，两次重建至少间隔该秒数
+    PROVIDER_ROUTES_REFRESH_INTERVAL = 30
+    HTTP_POOL_LIMIT = 32
+    HTTP_POOL_LIMIT_PER_HOST = 8
+    DOWNLOAD_CHUNK_SIZE = 64 * 1024
+    # 下载内容累积到该大小后再交给线程写盘，避免逐块切换线程
+    DOWNLOAD_WRITE_BUFFER = 1024 * 1024
+    # 文件名无法判断的图片嗅探文件头后，按来源缓存判定结果的条目数与有效期（秒）
+    GIF_VERDICT_CACHE_ENTRIES = 4096
+    GIF_VERDICT_TTL = 3600
+    GIF_SNIFF_TIMEOUT = 3
 
     def __init__(self, context: Context, config: AstrBotConfig):
+        # 插件加载耗时：从构造开始计时，到 initialize 完成为止
+        self._load_started = time.perf_counter()
         super().__init__(context)
         self.config = config
         self.default_provider_id = None
         self.ffmpeg_available = False
+        self.ffmpeg_path = None
         self._temp_files = set()  # 跟踪临时文件
         self._temp_files_lock = threading.Lock()  # 线程安全锁
+        # 构造时只计算路径，不访问文件系统；目录创建与索引载入在 initialize 中于线程内完成
+        self._data_dir = StarTools.get_data_dir(self.PLUGIN_NAME)
+        self._local_cache_dir = self._data_dir / "cache"  # 使用框架提供的数据目录
+        # 共享缓存目录：多个实例共用转换结果（如 NFS 或共享卷），索引仍保存在本地
+        shared_cache_dir = str(self.config.get("shared_cache_dir", "") or "").strip()
+        self.shared_cache = bool(shared_cache_dir)
         self._cache_dir = (
-            StarTools.get_data_dir(self.PLUGIN_NAME) / "cache"
-        )  # 使用框架提供的数据目录
-        self._cache_dir.mkdir(parents=True, exist_ok=True)  # 确保缓存目录存在
+            Path(shared_cache_dir).expanduser()
+            if self.shared_cache
+            else self._local_cache_dir
+        )
         self._frame_cache_dir = self._cache_dir / "frames"
-        self._frame_cache_dir.mkdir(parents=True, exist_ok=True)
-        self._cache_ttl = 86400  # 24 小时
+        self._sheet_cache_dir = self._cache_dir / "sheets"
+        # 缓存管理器：SQLite 索引记录条目大小与访问情况，按容量预算在后台淘汰。
+        # 同时维护 源(URL/路径) -> 内容摘要 的别名索引，命中后可跳过下载。
+        self._cache = CacheManager(
+            self._cache_dir,
+            max_bytes=int(float(self.config.get("cache_max_size_mb", 1024)) * 1024**2),
+            ttl=float(self.config.get("cache_ttl_hours", 24)) * 3600,
+            policy=self.config.get("cache_eviction_policy", "lru"),
+            index_dir=self._local_cache_dir,
+            shared=self.shared_cache,
+        )
+        # 热点缓存：重复出现的 GIF 直接在内存中解析出视频与预览帧路径，磁盘淘汰时同步失效
+        self._hot_cache = HotCache(int(self.config.get("hot_cache_entries", 512)))
+        self._cache.add_evict_listener(self._hot_cache.invalidate)
+        # GIF 判定缓存：来源(URL/路径) -> 是否为 GIF，避免重复嗅探同一张图片
+        self._gif_verdicts = HotCache(self.GIF_VERDICT_CACHE_ENTRIES)
+        # 运行指标：各阶段耗时与计数器，可通过 /gifstats 查看或定期写入 Prometheus 文本文件
+        self._metrics = Metrics()
+        metrics_file = self.config.get("metrics_file", "")
+        self.metrics_file = self._data_dir / metrics_file if metrics_file else None
+        self.metrics_interval = max(1.0, float(self.config.get("metrics_interval", 60)))
+        self._metrics_task: asyncio.Task | None = None
+        self._warm_up_task: asyncio.Task | None = None
+        # 单飞(single-flight)：key -> 进行中的任务，合并同一GIF的并发转换
+        self._inflight: dict[str, asyncio.Future] = {}
+        # 预热：收到消息时在后台提前转换其中的 GIF，进行中的预热任务数不超过预算
+        self.prewarm_enabled = bool(self.config.get("prewarm_enabled", False))
+        self.prewarm_max_concurrent = max(
+            1, int(self.config.get("prewarm_max_concurrent", 1))
+        )
+        self._prewarm_tasks: set[asyncio.Task] = set()
         self.preview_frame_count = max(
             1, int(self.config.get("preview_frame_count", 4))
         )
+        # 预览帧选取：uniform 按时间均匀采样；scene 按画面变化挑选关键帧并去除近似重复帧
+        self.frame_selection = self.config.get("frame_selection", "uniform")
+        self.scene_change_threshold = float(
+            self.config.get("scene_change_threshold", 0.03)
+        )
+        # 预览帧编码：默认原始分辨率的 PNG；可缩放到最大边长并改用有损格式，减小编码耗时与请求体积
+        self.preview_frame_format = self.config.get("preview_frame_format", "png")
+        if self.preview_frame_format not in ("png", "jpeg", "webp"):
+            self.preview_frame_format = "png"
+        self._frame_options = {
+            "count": self.preview_frame_count,
+            "selection": self.frame_selection,
+            "scene_threshold": self.scene_change_threshold,
+            "format": self.preview_frame_format,
+            "quality": int(self.config.get("preview_frame_quality", 85)),
+            "max_size": max(0, int(self.config.get("preview_frame_max_size", 0))),
+        }
+        # 预览帧参数参与帧缓存键，修改配置后不会命中旧参数生成的帧
+        self._frame_variant = hashlib.md5(
+            repr(sorted(self._frame_options.items())).encode()
+        ).hexdigest()[:8]
+        # 预览输出：frames 逐帧附带；contact_sheet 将选中的帧拼成一张带编号的网格图
+        self.preview_output = self.config.get("preview_output", "frames")
+        self.contact_sheet_columns = max(
+            0, int(self.config.get("contact_sheet_columns", 0))
+        )
+        self.contact_sheet_max_edge = max(
+            0, int(self.config.get("contact_sheet_max_edge", 1536))
+        )
+        # 一条消息含多张 GIF 时，所有 GIF 合计附带的预览帧上限
+        self.max_total_preview_frames = max(
+            1, int(self.config.get("max_total_preview_frames", 12))
+        )
+        # frames_only：只向 LLM 注入预览帧，跳过视频编码，需要视频时再按需生成
+        self.frames_only = (
+            self.config.get("conversion_mode", "video_and_frames") == "frames_only"
+        )
+        # 超过体积/时长上限的 GIF 只抽取预览帧，不编码视频（0 表示不限制）
+        self.max_video_gif_bytes = int(
+            float(self.config.get("max_video_gif_mb", 0)) * 1024 * 1024
+        )
+        self.max_video_gif_seconds = float(self.config.get("max_video_gif_seconds", 0))
+        # 启用转换的服务商：兼容单选的 enabled_provider_id，并支持多选列表
+        self.enabled_provider_ids = {
+            str(provider_id).strip()
+            for provider_id in [
+                self.config.get("enabled_provider_id", ""),
+                *(self.config.get("enabled_provider_ids", []) or []),
+            ]
+            if str(provider_id).strip()
+        }
+        # 按服务商覆盖转换模式（服务商ID -> 是否只需预览帧），未列出的使用 conversion_mode
+        self.provider_profiles = self._parse_provider_profiles(
+            self.config.get("provider_profiles", []) or []
+        )
+        # 服务商路由表：provider_id -> 路由；实例 id() -> (实例, 路由)。加载时构建，请求时 O(1) 查找
+        self._provider_routes: dict[str, dict] = {}
+        self._instance_routes: dict[int, tuple[object, dict]] = {}
+        self._routes_built_at = float("-inf")
+        # 独立的转换调度器：限制并发编码数量与排队深度，避免占满 CPU 拖慢机器人
+        self._scheduler = ConversionScheduler(
+            max_concurrency=self.config.get("max_concurrent_conversions", 2),
+            max_queue_depth=self.config.get("max_conversion_queue", 16),
+            wait_timeout=self.config.get("conversion_wait_timeout", 30),
+            executor_mode=self.config.get("conversion_executor", "thread"),
+            process_pool_size=self.config.get("process_pool_size", 0),
+            worker_initializer=_warm_up_worker,
+        )
 
-        # 在插件加载时检查 FFmpeg 是否存在
-        if shutil.which("ffmpeg") is None:
+        # 下载：插件级共享 HTTP 会话，限制单个 GIF 的大小与连接/读取超时
+        self._http_session: aiohttp.ClientSession | None = None
+        self.download_max_bytes = int(
+            float(self.config.get("max_gif_size_mb", 20)) * 1024 * 1024
+        )
+        self.download_connect_timeout = float(
+            self.config.get("download_connect_timeout", 10)
+        )
+        self.download_read_timeout = float(self.config.get("download_read_timeout", 30))
+
+        # 转换引擎：ffmpeg 直接调用子进程；moviepy 为兼容回退方案
+        self.conversion_engine = self.config.get("conversion_engine", "ffmpeg")
+        self.ffmpeg_timeout = float(self.config.get("ffmpeg_timeout", 120)) or None
+        # MP4 编码参数：在编码耗时与输出体积之间取舍，满足服务商的上传限制
+        self._video_profile = {
+            "preset": self.config.get("video_preset", "ultrafast"),
+            "crf": int(self.config.get("video_crf", 23)),
+            "bitrate": str(self.config.get("video_bitrate", "") or "").strip(),
+            "max_width": max(0, int(self.config.get("video_max_width", 0))),
+            "max_height": max(0, int(self.config.get("video_max_height", 0))),
+            "max_fps": max(0.0, float(self.config.get("video_max_fps", 0))),
+            "max_duration": max(0.0, float(self.config.get("video_max_duration", 0))),
+            "pix_fmt": self.config.get("video_pix_fmt", "yuv420p"),
+        }
+        # 编码参数参与视频缓存键，修改配置后不会命中旧参数编码的视频
+        self._video_variant = hashlib.md5(
+            repr(sorted(self._video_profile.items())).encode()
+        ).hexdigest()[:8]
+        self._init_seconds = time.perf_counter() - self._load_started
+
+    def _parse_provider_profiles(self, items: list) -> dict[str, bool]:
+        """解析 `服务商ID=模式` 形式的服务商配置，返回 服务商ID -> 是否只需预览帧。"""
+        profiles: dict[str, bool] = {}
+        for item in items:
+            provider_id, _, mode = str(item).partition("=")
+            provider_id, mode = provider_id.strip(), mode.strip()
+            if not provider_id or mode not in ("video_and_frames", "frames_only"):
+                logger.warning(f"[{self.PLUGIN_NAME}] 忽略无效的服务商配置: {item}")
+                continue
+            profiles[provider_id] = mode == "frames_only"
+        return profiles
+
+    def _make_provider_route(self, provider_id: str) -> dict:
+        """计算单个服务商的路由：是否启用转换，以及是否只需预览帧（仅支持图片的服务商）。"""
+        if self.enabled_provider_ids:
+            enabled = provider_id in self.enabled_provider_ids
+        else:
+            enabled = provider_id == self.default_provider_id
+        return {
+            "provider_id": provider_id,
+            "enabled": enabled,
+            "frames_only": self.provider_profiles.get(provider_id, self.frames_only),
+        }
+
+    def _build_provider_routes(self):
+        """遍历全部服务商构建路由表。自动模式下同时刷新默认服务商。"""
+        self._routes_built_at = time.monotonic()
+        try:
+            if not self.enabled_provider_ids:
+                self.default_provider_id = self._get_default_provider_id()
+            routes: dict[str, dict] = {}
+            instances: dict[int, tuple[object, dict]] = {}
+            for provider_id, provider in self._get_provider_map().items():
+                route = self._make_provider_route(provider_id)
+                routes[provider_id] = route
+                instances[id(provider)] = (provider, route)
+        except Exception as e:
             logger.error(
-                f"插件 [{self.PLUGIN_NAME}] 加载失败：未在系统中找到核心依赖 FFmpeg。"
-                "GIF 转换功能将无法使用。请参照 README.md 安装 FFmpeg 后重启 AstrBot。"
+                f"[{self.PLUGIN_NAME}] 构建服务商路由表失败: {e}", exc_info=True
             )
-        else:
-            self.ffmpeg_available = True
-            enabled_provider_id = self.config.get("enabled_provider_id", "")
-            if enabled_provider_id:
-                logger.info(
-                    f"{self.PLUGIN_NAME} 已加载，运行在【手动模式】，适配服务商: {enabled_provider_id}"
-                )
-            else:
-                try:
-                    self.default_provider_id = self._get_default_provider_id()
-                except Exception:
-                    self.default_provider_id = None
-                logger.info(
-                    f"{self.PLUGIN_NAME} 已加载，运行在【自动模式】，默认服务商: {self.default_provider_id}"
-                )
+            return
+        self._provider_routes, self._instance_routes = routes, instances
+        logger.debug(
+            f"[{self.PLUGIN_NAME}] 服务商路由表: "
+            f"{ {pid: (r['enabled'], r['frames_only']) for pid, r in routes.items()} }"
+        )
+
+    def _refresh_provider_routes(self) -> bool:
+        """服务商配置变化后（出现未知的服务商或实例）重建路由表，限制重建频率。"""
+        elapsed = time.monotonic() - self._routes_built_at
+        if elapsed < self.PROVIDER_ROUTES_REFRESH_INTERVAL:
+            return False
+        self._build_provider_routes()
+        return True
+
+    def _resolve_provider_route(self, event: AstrMessageEvent, req) -> dict | None:
+        """
+        查找本次请求所用服务商的路由。请求带有 provider_id 时按 ID 查找，
+        否则按会话当前使用的服务商实例查找；路由表未命中时才回退到逐个匹配。
+        """
+        # 自动模式下加载时尚未获取到默认服务商：每次请求重新获取，获取到后重建路由表。
+        # 在此之前计算出的路由都不缓存，避免插件在重载前一直处于停用状态。
+        provisional = not self.enabled_provider_ids and self.default_provider_id is None
+        if provisional:
+            self.default_provider_id = self._get_default_provider_id()
+            if self.default_provider_id is not None:
+                self._build_provider_routes()
+                provisional = False
+
+        provider_id = getattr(req, "provider_id", None)
+        if provider_id:
+            route = self._provider_routes.get(provider_id)
+            if route is None and self._refresh_provider_routes():
+                route = self._provider_routes.get(provider_id)
+            if route is None:
+                route = self._make_provider_route(provider_id)
+                if not provisional:
+                    self._provider_routes[provider_id] = route
+            return route
+
+        try:
+            provider_inst = self.context.get_using_provider(
+                umo=event.unified_msg_origin
+            )
+        except Exception as e:
+            logger.error(f"[{self.PLUGIN_NAME}] 获取provider时出错: {e}", exc_info=True)
+            return None
+        if not provider_inst:
+            return None
+        entry = self._instance_routes.get(id(provider_inst))
+        if entry is None and self._refresh_provider_routes():
+            entry = self._instance_routes.get(id(provider_inst))
+        if entry is not None and entry[0] is provider_inst:
+            return entry[1]
+
+        provider_id = self._get_provider_id_by_instance(provider_inst)
+        if not provider_id:
+            return None
+        route = self._provider_routes.get(provider_id) or self._make_provider_route(
+            provider_id
+        )
+        if not provisional:
+            self._instance_routes[id(provider_inst)] = (provider_inst, route)
+        return route
 
     def _get_provider_map(self) -> dict[str, object]:
         """获取 provider_id -> provider 实例的映射。"""
@@ -212,7 +443,9 @@ class GifToVideoPlugin(Star):
         with self._temp_files_lock:
             for temp_file in list(self._temp_files):
                 try:
-                    if temp_file.exists():
+                    if temp_file.is_dir():
+                        shutil.rmtree(temp_file, ignore_errors=True)
+                    elif temp_file.exists():
                         temp_file.unlink()
                     parent_dir = temp_file.parent
                     if parent_dir.exists() and not any(parent_dir.iterdir()):
@@ -223,385 +456,860 @@ class GifToVideoPlugin(Star):
                         f"[{self.PLUGIN_NAME}] 清理临时文件失败 {temp_file}: {e}"
                     )
 
-    def _cleanup_request_temp_files(
-        self, temp_dir: Path, gif_path: Path, mp4_path: Path
-    ):
-        """清理单次请求创建的临时文件和目录"""
-        for file_path in [gif_path, mp4_path, temp_dir]:
-            try:
-                if file_path.exists():
-                    if file_path.is_file():
-                        file_path.unlink()
-                    elif file_path.is_dir():
-                        shutil.rmtree(file_path, ignore_errors=True)
-            except Exception as e:
-                logger.warning(
-                    f"[{self.PLUGIN_NAME}] 清理请求临时文件失败 {file_path}: {e}"
-                )
+    def _cleanup_request_temp_files(self, temp_dir: Path):
+        """清理单次请求创建的临时目录（下载的 GIF、输出视频与暂存帧均位于其中）"""
+        try:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+        except Exception as e:
+            logger.warning(f"[{self.PLUGIN_NAME}] 清理请求临时文件失败 {temp_dir}: {e}")
 
     def _register_temp_file(self, file_path: Path):
         """注册临时文件以便后续清理"""
         with self._temp_files_lock:
             self._temp_files.add(file_path)
 
-    def _is_cache_entry_valid(self, path: Path) -> bool:
-        try:
-            return time.time() - path.stat().st_mtime <= self._cache_ttl
-        except FileNotFoundError:
-            return False
+    def _get_source_key(self, gif_source: str) -> str:
+        """根据GIF源生成别名索引键。本地文件附带大小与修改时间，避免临时路径复用导致误命中。"""
+        if not gif_source.startswith(("http://", "https://")):
+            try:
+                stat = os.stat(gif_source)
+                gif_source = f"{gif_source}:{stat.st_size}:{stat.st_mtime_ns}"
+            except OSError:
+                pass
+        return hashlib.md5(gif_source.encode()).hexdigest()
 
-    def _cleanup_expired_cache(self):
-        """清理过期的缓存文件（超过24小时）"""
-        try:
-            current_time = time.time()
-            for cache_file in self._cache_dir.glob("*.mp4"):
-                if (
-                    cache_file.is_file()
-                    and current_time - cache_file.stat().st_mtime > self._cache_ttl
-                ):
-                    cache_file.unlink()
-                    logger.debug(f"[{self.PLUGIN_NAME}] 清理过期缓存文件: {cache_file}")
-
-            for frame_dir in self._frame_cache_dir.glob("*"):
-                if frame_dir.is_dir():
-                    try:
-                        if current_time - frame_dir.stat().st_mtime > self._cache_ttl:
-                            shutil.rmtree(frame_dir, ignore_errors=True)
-                            logger.debug(
-                                f"[{self.PLUGIN_NAME}] 清理过期帧缓存: {frame_dir}"
-                            )
-                    except FileNotFoundError:
-                        continue
-        except Exception as e:
-            logger.warning(f"[{self.PLUGIN_NAME}] 清理过期缓存失败: {e}")
+    @staticmethod
+    def _hash_file(file_path: Path) -> str:
+        """计算GIF内容摘要，作为缓存主键。相同内容不同URL的GIF共享同一缓存条目。"""
+        digest = hashlib.sha256()
+        with open(file_path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
 
-    def _get_cache_key(self, gif_source: str) -> str:
-        """根据GIF源生成缓存键"""
-        # 使用MD5哈希作为缓存键
-        return hashlib.md5(gif_source.encode()).hexdigest()
+    def _lookup_alias(self, source_key: str) -> str | None:
+        """通过别名索引查找GIF源对应的内容摘要（如果存在且未过期）"""
+        return self._cache.lookup_alias(source_key)
 
-    def _get_cached_video_path(self, gif_source: str) -> Path | None:
-        """获取缓存的视频文件路径（如果存在且未过期）"""
-        cache_key = self._get_cache_key(gif_source)
-        cached_file = self._cache_dir / f"{cache_key}.mp4"
+    def _remember_alias(self, source_key: str, cache_key: str):
+        """记录GIF源与内容摘要的对应关系"""
+        self._cache.put_alias(source_key, cache_key)
 
-        if cached_file.exists() and self._is_cache_entry_valid(cached_file):
-            logger.info(f"[{self.PLUGIN_NAME}] 使用缓存文件: {cached_file}")
-            return cached_file
+    def _video_key(self, cache_key: str) -> str:
+        """视频的缓存键：内容摘要 + 编码参数摘要。"""
+        return f"{cache_key}_{self._video_variant}"
 
-        return None
+    def _get_cache_entry(self, key: str, kind: str, path: Path) -> Path | None:
+        """
+        查找磁盘缓存条目。共享缓存目录下本地索引未命中时，
+        检查其他实例是否已在约定路径 path 发布了该条目，有则登记到本地索引。
+        """
+        cached = self._cache.get(key, kind)
+        if cached is None and self.shared_cache:
+            cached = self._cache.adopt(key, kind, path)
+        return cached
+
+    def _hot_lookup(self, key: str, kind: str):
+        """查询热点缓存。命中时同步记录磁盘缓存的访问（只更新内存统计），保持淘汰顺序准确。"""
+        value = self._hot_cache.get(key, kind)
+        if value is not None:
+            self._cache.touch(key, kind)
+        return value
+
+    async def _cached_lookup(self, key: str, kind: str, loader):
+        """先查热点缓存，未命中时在线程中执行 loader 访问磁盘缓存，并将结果放入热点缓存。"""
+        with self._metrics.timed("cache_lookup"):
+            value = self._hot_lookup(key, kind)
+            if value is not None:
+                self._metrics.inc("cache_hits_total", tier="hot", kind=kind)
+                return value
+            value = await asyncio.to_thread(loader, key)
+        if value:
+            self._metrics.inc("cache_hits_total", tier="disk", kind=kind)
+            expires_at = self._cache.expires_at(key, kind)
+            if self.shared_cache:
+                # 其他实例淘汰文件时不会通知本实例，热点条目只保留较短时间
+                shared_expires_at = time.time() + self.SHARED_HOT_CACHE_TTL
+                expires_at = min(expires_at or shared_expires_at, shared_expires_at)
+            self._hot_cache.put(key, kind, value, expires_at)
+        else:
+            self._metrics.inc("cache_misses_total", kind=kind)
+        return value
+
+    async def _get_cached_video_path(self, cache_key: str) -> Path | None:
+        """获取缓存的视频文件路径（如果存在且未过期）"""
+        cached_file = await self._cached_lookup(
+            self._video_key(cache_key),
+            KIND_VIDEO,
+            lambda video_key: self._get_cache_entry(
+                video_key, KIND_VIDEO, self._cache_dir / f"{video_key}.mp4"
+            ),
+        )
+        if cached_file:
+            logger.debug(f"[{self.PLUGIN_NAME}] 使用缓存文件: {cached_file}")
+        return cached_file
 
-    def _cache_video_file(self, gif_source: str, video_path: Path) -> Path:
-        """将转换后的视频文件缓存"""
-        cache_key = self._get_cache_key(gif_source)
-        cached_file = self._cache_dir / f"{cache_key}.mp4"
+    def _cache_video_file(self, cache_key: str, video_path: Path) -> Path:
+        """将暂存区中转换好的视频原子地发布到缓存"""
+        video_key = self._video_key(cache_key)
+        cached_file = self._cache_dir / f"{video_key}.mp4"
 
         try:
-            # 复制文件到缓存目录
-            shutil.copy2(video_path, cached_file)
+            # 暂存区与缓存位于同一文件系统，rename 即可，无需复制
+            publish_file(video_path, cached_file)
+            self._cache.add(video_key, KIND_VIDEO, cached_file)
             logger.info(f"[{self.PLUGIN_NAME}] 缓存视频文件: {cached_file}")
             return cached_file
         except Exception as e:
             logger.warning(f"[{self.PLUGIN_NAME}] 缓存视频文件失败: {e}")
             return video_path  # 如果缓存失败，返回原路径
 
-    def _get_preview_frame_dir(self, cache_key: str) -> Path:
-        return self._frame_cache_dir / cache_key
+    def _get_cached_source_path(self, cache_key: str) -> Path | None:
+        """获取缓存的源 GIF（仅预览帧模式保留，用于按需生成视频）"""
+        return self._get_cache_entry(
+            cache_key, KIND_SOURCE, self._cache_dir / f"{cache_key}.gif"
+        )
+
+    def _cache_source_file(self, cache_key: str, gif_path: Path) -> Path | None:
+        """
+        保留源 GIF，之后需要视频时无需重新下载。暂存区中的下载文件直接移入缓存，
+        用户的本地文件则复制一份，原文件保持不动。
+        """
+        cached_file = self._cache_dir / f"{cache_key}.gif"
+        try:
+            publish_file(
+                gif_path,
+                cached_file,
+                keep_source=not gif_path.is_relative_to(self._cache.staging_dir),
+            )
+            self._cache.add(cache_key, KIND_SOURCE, cached_file)
+            return cached_file
+        except Exception as e:
+            logger.warning(f"[{self.PLUGIN_NAME}] 缓存源 GIF 失败: {e}")
+            return None
+
+    def _frames_key(self, cache_key: str) -> str:
+        """预览帧的缓存键：内容摘要 + 预览帧参数摘要。"""
+        return f"{cache_key}_{self._frame_variant}"
 
-    def _get_cached_preview_frames(self, cache_key: str) -> list[Path]:
-        frame_dir = self._get_preview_frame_dir(cache_key)
-        if frame_dir.exists() and self._is_cache_entry_valid(frame_dir):
-            frames = sorted(frame_dir.glob("*.png"))
+    def _get_preview_frame_dir(self, frames_key: str) -> Path:
+        return self._frame_cache_dir / frames_key
+
+    def _publish_preview_frames(
+        self, frames_key: str, staging_dir: Path, frames: list[str]
+    ) -> list[Path]:
+        """将暂存区中生成的预览帧整体发布到缓存，返回发布后的帧路径。"""
+        frame_dir = publish_dir(staging_dir, self._get_preview_frame_dir(frames_key))
+        self._cache.add(frames_key, KIND_FRAMES, frame_dir)
+        return [frame_dir / Path(frame).name for frame in frames]
+
+    def _load_preview_frames(self, frames_key: str) -> list[Path]:
+        frame_dir = self._get_cache_entry(
+            frames_key, KIND_FRAMES, self._get_preview_frame_dir(frames_key)
+        )
+        # 只读取带完成标记的帧目录，避免看到写入一半的帧
+        if frame_dir and is_complete_frame_dir(frame_dir):
+            frames = sorted(frame_dir.glob("*_frame_*"))
             if frames:
                 return frames
         return []
 
-    def _generate_preview_frames(self, video_path: Path, cache_key: str) -> list[Path]:
-        """生成 GIF 的预览帧，帮助非视频模型理解完整动图。"""
-        frame_dir = self._get_preview_frame_dir(cache_key)
-        frame_dir.mkdir(parents=True, exist_ok=True)
-        generated_frames: list[Path] = []
+    async def _get_cached_preview_frames(self, cache_key: str) -> list[Path]:
+        frames = await self._cached_lookup(
+            self._frames_key(cache_key), KIND_FRAMES, self._load_preview_frames
+        )
+        return list(frames) if frames else []
+
+    async def _ensure_preview_frames(
+        self, cache_key: str, video_path: Path | None, gif_path: Path | None = None
+    ) -> list[Path]:
+        """
+        获取或生成 GIF 的预览帧。生成过程经由转换调度器限流。
+        没有视频时直接从 gif_path 或缓存的源 GIF 抽帧。
+        """
+        cached_frames = await self._get_cached_preview_frames(cache_key)
+        if cached_frames:
+            return cached_frames
 
+        if video_path:
+            frame_func, frame_source = _generate_preview_frames, video_path
+        elif gif_path:
+            frame_func, frame_source = _sample_gif_frames, gif_path
+        else:
+            frame_source = await asyncio.to_thread(
+                self._get_cached_source_path, cache_key
+            )
+            if not frame_source:
+                return []
+            frame_func = _sample_gif_frames
+        staging_dir = await asyncio.to_thread(self._cache.make_staging_dir, "frames_")
         try:
-            with VideoFileClip(str(video_path)) as clip:
-                duration = clip.duration or 0
-                sample_count = max(1, self.preview_frame_count)
-
-                for idx in range(sample_count):
-                    if duration <= 0:
-                        t = 0
-                    else:
-                        fraction = (idx + 0.5) / sample_count
-                        t = min(max(fraction * duration, 0), max(duration - 0.01, 0))
-                    try:
-                        frame = clip.get_frame(t)
-                    except Exception as frame_error:
-                        logger.warning(
-                            f"[{self.PLUGIN_NAME}] 提取第 {idx} 帧失败: {frame_error}"
-                        )
-                        continue
-                    frame_image = Image.fromarray(frame)
-                    frame_path = frame_dir / f"{cache_key}_frame_{idx}.png"
-                    frame_image.save(frame_path)
-                    generated_frames.append(frame_path)
-
-            if generated_frames:
-                # 更新目录时间戳，便于 TTL 计算
-                frame_dir.touch(exist_ok=True)
-            return generated_frames
+            with self._metrics.timed("frames"):
+                frames = await self._scheduler.run(
+                    frame_func,
+                    str(frame_source),
+                    str(staging_dir),
+                    self._frames_key(cache_key),
+                    self._frame_options,
+                )
+            if not frames:
+                return []
+            return await asyncio.to_thread(
+                self._publish_preview_frames,
+                self._frames_key(cache_key),
+                staging_dir,
+                frames,
+            )
+        except SchedulerSaturatedError:
+            raise
         except Exception as e:
+            self._metrics.inc("failures_total", reason="frames")
             logger.warning(
                 f"[{self.PLUGIN_NAME}] 生成 GIF 预览帧失败: {e}", exc_info=True
             )
-            shutil.rmtree(frame_dir, ignore_errors=True)
             return []
-
-    def _ensure_preview_frames(self, cache_key: str, video_path: Path) -> list[Path]:
-        """获取或生成 GIF 的预览帧。"""
-        cached_frames = self._get_cached_preview_frames(cache_key)
-        if cached_frames:
-            return cached_frames
-        return self._generate_preview_frames(video_path, cache_key)
-
-    def _inject_preview_hint(self, prompt: str | None, frame_count: int) -> str:
-        """在 prompt 中注入说明，提醒 LLM 已附带多帧图片。"""
+        finally:
+            await asyncio.to_thread(shutil.rmtree, staging_dir, True)
+
+    @staticmethod
+    def _preview_hint(
+        frame_count: int,
+        saturated: bool = False,
+        first_frame: int | None = None,
+        over_budget: bool = False,
+        grid: tuple[int, int] | None = None,
+    ) -> str:
+        """
+        生成单张 GIF 的 prompt 说明，提醒 LLM 已附带多帧图片。
+        first_frame 为该 GIF 首帧在随附图片中的序号（从 1 开始），多张 GIF 时用于区分。
+        grid 为 (行数, 列数) 时表示这些帧已拼成一张网格图。
+        """
+        if saturated:
+            return (
+                "[系统提示] 用户发送了一张 GIF 动图，但当前转换任务繁忙，"
+                "本次未能附带动图内容，请结合上下文理解该动图。"
+            )
+        if frame_count > 0 and grid:
+            position = f"（随附图片第 {first_frame} 张）" if first_frame else ""
+            return (
+                f"[系统提示] GIF 的 {frame_count} 帧已按时间顺序拼成一张 "
+                f"{grid[0]}×{grid[1]} 的网格图{position}，每格左上角数字为帧序号，"
+                "请按序号顺序理解整段动画。"
+            )
         if frame_count > 0:
-            hint = f"[系统提示] GIF 已被拆分为 {frame_count} 帧图片，请综合所有帧理解整段动画。"
-        else:
-            hint = (
-                "[系统提示] GIF 已转换为视频，但当前服务商仅支持图片，"
-                "本次未能生成预览帧，请结合上下文理解该动图。"
-            )
-        prompt = prompt or ""
-        if hint in prompt:
-            return prompt
-        marker = "[视频(GIF已转换)]"
-        if marker in prompt:
-            return prompt.replace(marker, f"{marker}{hint}")
-        return f"{hint}\n{prompt}" if prompt else hint
+            if first_frame is None:
+                return f"[系统提示] GIF 已被拆分为 {frame_count} 帧图片，请综合所有帧理解整段动画。"
+            last_frame = first_frame + frame_count - 1
+            return (
+                f"[系统提示] 该 GIF 已被拆分为 {frame_count} 帧图片"
+                f"（随附图片第 {first_frame}-{last_frame} 张），请综合这些帧理解该动画。"
+            )
+        if over_budget:
+            return (
+                "[系统提示] GIF 已转换，但本条消息附带的预览帧已达上限，"
+                "未能附带该动图的帧，请结合上下文理解该动图。"
+            )
+        return (
+            "[系统提示] GIF 已转换，但当前服务商仅支持图片，"
+            "本次未能生成预览帧，请结合上下文理解该动图。"
+        )
 
-    async def terminate(self):
-        """插件终止时调用，释放资源"""
-        logger.info(f"[{self.PLUGIN_NAME}] 插件已终止，清理临时文件")
-        self._cleanup_temp_files()
-        # 可选：在插件终止时清理过期缓存
-        # self._cleanup_expired_cache()
+    def _allocate_frame_budget(self, frame_counts: list[int]) -> list[int]:
+        """按消息顺序轮流为每张 GIF 分配预览帧，合计不超过单条消息的帧数上限。"""
+        allocated = [0] * len(frame_counts)
+        budget = self.max_total_preview_frames
+        while budget > 0:
+            progressed = False
+            for idx, count in enumerate(frame_counts):
+                if budget and allocated[idx] < count:
+                    allocated[idx] += 1
+                    budget -= 1
+                    progressed = True
+            if not progressed:
+                break
+        return allocated
+
+    @staticmethod
+    def _pick_frames(frames: list[Path], count: int) -> list[Path]:
+        """从按时间排序的预览帧中均匀选取 count 帧。"""
+        if count >= len(frames):
+            return frames
+        return [frames[int((idx + 0.5) * len(frames) / count)] for idx in range(count)]
+
+    def _publish_contact_sheet(self, sheet_key: str, staging_path: Path) -> Path:
+        sheet_path = publish_file(
+            staging_path, self._sheet_cache_dir / staging_path.name
+        )
+        self._cache.add(sheet_key, KIND_SHEET, sheet_path)
+        return sheet_path
+
+    async def _ensure_contact_sheet(
+        self, cache_key: str, frames: list[Path]
+    ) -> Path | None:
+        """获取或生成由指定预览帧拼成的网格图。失败或繁忙时返回 None，由调用方逐帧附带。"""
+        layout = ",".join(
+            [
+                str(self.contact_sheet_columns),
+                str(self.contact_sheet_max_edge),
+                *(frame.name for frame in frames),
+            ]
+        )
+        sheet_key = f"{cache_key}_{hashlib.md5(layout.encode()).hexdigest()[:12]}"
+        sheet_name = f"{sheet_key}.{_frame_extension(self.preview_frame_format)}"
+        sheet_path = await self._cached_lookup(
+            sheet_key,
+            KIND_SHEET,
+            lambda key: self._get_cache_entry(
+                key, KIND_SHEET, self._sheet_cache_dir / sheet_name
+            ),
+        )
+        if sheet_path:
+            return sheet_path
 
-    @filter.on_llm_request(priority=100)
-    async def handle_gif_message(self, event: AstrMessageEvent, req):
+        async def _build() -> Path | None:
+            staging_dir = await asyncio.to_thread(
+                self._cache.make_staging_dir, "sheet_"
+            )
+            try:
+                staging_path = staging_dir / sheet_name
+                with self._metrics.timed("contact_sheet"):
+                    await self._scheduler.run(
+                        _build_contact_sheet,
+                        [str(frame) for frame in frames],
+                        str(staging_path),
+                        self.contact_sheet_columns,
+                        self.contact_sheet_max_edge,
+                        self._frame_options,
+                    )
+                return await asyncio.to_thread(
+                    self._publish_contact_sheet, sheet_key, staging_path
+                )
+            except Exception as e:
+                logger.warning(f"[{self.PLUGIN_NAME}] 生成预览帧网格图失败: {e}")
+                return None
+            finally:
+                await asyncio.to_thread(shutil.rmtree, staging_dir, True)
+
+        return await self._single_flight(f"sheet:{sheet_key}", _build)
+
+    async def _single_flight(self, key: str, factory):
+        """同一 key 的并发调用只执行一次 factory，其余调用等待并共享其结果。"""
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(factory())
+            self._inflight[key] = task
+
+            def _forget(done_task, key=key):
+                if self._inflight.get(key) is done_task:
+                    del self._inflight[key]
+
+            task.add_done_callback(_forget)
+        # shield: 单个等待者被取消时不影响共享任务与其他等待者
+        return await asyncio.shield(task)
+
+    async def _convert_gif_source(
+        self,
+        gif_source: str,
+        source_key: str,
+        gif_url: str | None,
+        gif_file: str | None,
+        frames_only: bool,
+    ) -> tuple[str, Path | None] | None:
         """
-        处理包含GIF的消息，将其转换为MP4视频
+        下载GIF（本地文件直接原地读取）并转换，返回 (缓存键, 视频路径)。失败时返回 None。
+        预览帧模式下不编码视频，视频路径为 None。
         """
-        if not self.ffmpeg_available:
-            logger.warning(f"[{self.PLUGIN_NAME}] FFmpeg不可用，跳过GIF处理")
-            return
+        # 首先通过别名索引检查缓存，命中时无需下载
+        cache_key = self._lookup_alias(source_key)
+        if cache_key:
+            cached = await self._get_cached_result(cache_key, frames_only)
+            if cached:
+                return cached
+
+        # 在缓存暂存区创建临时目录，转换结果可直接 rename 进缓存
+        temp_dir = await asyncio.to_thread(self._cache.make_staging_dir)
+        local_gif_path = temp_dir / "input.gif"
+        local_mp4_path = temp_dir / "output.mp4"
+        self._register_temp_file(temp_dir)
+
+        failure_reason = "download"
+        try:
+            if gif_url and gif_url.startswith(("http://", "https://")):
+                # 下载时同步计算内容摘要，无需再次读取文件
+                with self._metrics.timed("download"):
+                    cache_key = await self._download_gif(gif_url, local_gif_path)
+            elif gif_file:
+                # 本地文件无需复制，直接读取原文件
+                local_gif_path = Path(gif_file)
+                cache_key = await asyncio.to_thread(self._hash_file, local_gif_path)
+            else:
+                logger.error(f"[{self.PLUGIN_NAME}] 无效的GIF源")
+                return None
 
-        # 添加调试日志
-        logger.info(f"[{self.PLUGIN_NAME}] 收到LLM请求，检查是否包含GIF")
-
-        # 1. 检查消息中是否包含 GIF
-        gif_url = None
-        gif_file = None
-
-        # 检查消息链中的图片组件
-        for comp in event.message_obj.message:
-            if isinstance(comp, Comp.Image):
-                # 检查是否是GIF文件
-                if comp.file and comp.file.lower().endswith(".gif"):
-                    gif_file = comp.file
-                    gif_url = comp.url
-                    logger.info(f"[{self.PLUGIN_NAME}] 检测到GIF文件: {gif_file}")
-                    break
-                # 检查URL是否包含GIF
-                elif comp.url and ".gif" in comp.url.lower():
-                    gif_url = comp.url
-                    logger.info(f"[{self.PLUGIN_NAME}] 检测到GIF URL: {gif_url}")
-                    break
+            # 按内容摘要查找缓存，不同URL的同一GIF只需转换一次
+            failure_reason = "convert"
+            await asyncio.to_thread(self._remember_alias, source_key, cache_key)
+            video_path = await self._single_flight(
+                f"content:{cache_key}:{self._mode_key(frames_only)}",
+                lambda: self._convert_gif_content_locked(
+                    cache_key, local_gif_path, local_mp4_path, frames_only
+                ),
+            )
+            return cache_key, video_path
+        except SchedulerSaturatedError:
+            raise
+        except Exception as e:
+            self._metrics.inc("failures_total", reason=failure_reason)
+            logger.error(
+                f"[{self.PLUGIN_NAME}] 处理GIF失败 ({gif_source}): {e}",
+                exc_info=True,
+            )
+            return None
+        finally:
+            await asyncio.to_thread(self._cleanup_request_temp_files, temp_dir)
+
+    def _get_http_session(self) -> aiohttp.ClientSession:
+        """获取插件共享的 HTTP 会话（首次使用时创建），复用连接池。"""
+        if self._http_session is None or self._http_session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.HTTP_POOL_LIMIT,
+                limit_per_host=self.HTTP_POOL_LIMIT_PER_HOST,
+                ttl_dns_cache=300,
+            )
+            timeout = aiohttp.ClientTimeout(
+                total=None,
+                sock_connect=self.download_connect_timeout,
+                sock_read=self.download_read_timeout,
+            )
+            self._http_session = aiohttp.ClientSession(
+                connector=connector, timeout=timeout
+            )
+        return self._http_session
 
-        if not gif_url and not gif_file:
-            logger.debug(f"[{self.PLUGIN_NAME}] 未检测到GIF，跳过处理")
-            return
+    async def _download_gif(self, gif_url: str, dest_path: Path) -> str:
+        """
+        流式下载 GIF 到本地文件并返回内容摘要。
+        先检查 Content-Length，下载过程中超过大小上限立即中止。
+        """
+        session = self._get_http_session()
+        digest = hashlib.sha256()
+        received = 0
+        async with session.get(gif_url) as resp:
+            resp.raise_for_status()
+            if resp.content_length and resp.content_length > self.download_max_bytes:
+                raise ValueError(
+                    f"GIF 大小 {resp.content_length} 字节超过上限 "
+                    f"{self.download_max_bytes} 字节"
+                )
+            # 文件的打开、写入与关闭都在线程中进行，慢速磁盘不会阻塞事件循环
+            f = await asyncio.to_thread(open, dest_path, "wb")
+            try:
+                buffer = bytearray()
+                async for chunk in resp.content.iter_chunked(self.DOWNLOAD_CHUNK_SIZE):
+                    received += len(chunk)
+                    if received > self.download_max_bytes:
+                        raise ValueError(
+                            f"GIF 下载超过大小上限 {self.download_max_bytes} 字节"
+                        )
+                    digest.update(chunk)
+                    buffer += chunk
+                    if len(buffer) >= self.DOWNLOAD_WRITE_BUFFER:
+                        await asyncio.to_thread(f.write, bytes(buffer))
+                        buffer.clear()
+                if buffer:
+                    await asyncio.to_thread(f.write, bytes(buffer))
+            finally:
+                await asyncio.to_thread(f.close)
+                self._metrics.inc("downloaded_bytes_total", received)
+        return digest.hexdigest()
 
-        # 2. 检查插件是否为当前会话启用
-        provider_id = getattr(req, "provider_id", None)
-        logger.info(f"[{self.PLUGIN_NAME}] 获取到provider_id: {provider_id}")
+    async def _get_cached_result(
+        self, cache_key: str, frames_only: bool
+    ) -> tuple[str, Path | None] | None:
+        """
+        根据内容摘要查找已缓存的转换结果。视频缺失但保留了源 GIF 时按需补齐视频。
+        探测结果表明无需视频（静态图或超出上限）时，只要预览帧仍在缓存中即视为命中。
+        """
+        video_path = await self._get_cached_video_path(cache_key)
+        if video_path:
+            return cache_key, video_path
+        probe = self._cache.get_probe(cache_key)
+        if (
+            probe
+            and self._probe_route(probe, frames_only) != self.ROUTE_VIDEO
+            and await self._get_cached_preview_frames(cache_key)
+        ):
+            return cache_key, None
+        if not await asyncio.to_thread(self._get_cached_source_path, cache_key):
+            return None
+        if frames_only:
+            return cache_key, None
+        video_path = await self._ensure_video(cache_key)
+        return (cache_key, video_path) if video_path else None
+
+    async def _ensure_video(self, cache_key: str) -> Path | None:
+        """按需从缓存的源 GIF 编码视频（预览帧模式下跳过的编码在此延后执行）。"""
+        video_path = await self._get_cached_video_path(cache_key)
+        if video_path:
+            return video_path
+        source_path = await asyncio.to_thread(self._get_cached_source_path, cache_key)
+        if not source_path:
+            return None
 
-        if not provider_id:
-            # 尝试从其他方式获取provider_id
+        async def _encode() -> Path:
+            temp_dir = await asyncio.to_thread(self._cache.make_staging_dir)
+            local_mp4_path = temp_dir / "output.mp4"
+            self._register_temp_file(local_mp4_path)
+            self._register_temp_file(temp_dir)
             try:
-                provider_inst = self.context.get_using_provider(
-                    umo=event.unified_msg_origin
-                )
-                logger.info(
-                    f"[{self.PLUGIN_NAME}] 从上下文获取到provider实例: {provider_inst}"
+                with self._metrics.timed("encode"):
+                    await self._encode_gif(source_path, local_mp4_path)
+                logger.info(f"[{self.PLUGIN_NAME}] 按需生成视频成功: {cache_key}")
+                return await asyncio.to_thread(
+                    self._cache_video_file, cache_key, local_mp4_path
                 )
-                logger.info(
-                    f"[{self.PLUGIN_NAME}] Provider实例类型: {type(provider_inst)}"
-                )
-                logger.info(
-                    f"[{self.PLUGIN_NAME}] Provider实例属性: {[attr for attr in dir(provider_inst) if not attr.startswith('_')]}"
+            finally:
+                # 只清理临时目录，源 GIF 仍保留在缓存中
+                await asyncio.to_thread(shutil.rmtree, temp_dir, True)
+
+        return await self._single_flight(f"video:{cache_key}", _encode)
+
+    async def _encode_gif(
+        self,
+        local_gif_path: Path,
+        local_mp4_path: Path,
+        frame_dir: Path | None = None,
+        cache_key: str | None = None,
+    ) -> list[str]:
+        """
+        按配置的转换引擎编码 GIF。FFmpeg 引擎失败时回退到 MoviePy。
+        指定 frame_dir 时在同一次解码中一并输出预览帧，返回帧文件路径。
+        """
+        frame_dir_str = str(frame_dir) if frame_dir else None
+        frames_key = self._frames_key(cache_key) if cache_key else None
+        if self.conversion_engine == "ffmpeg":
+            frame_indices = None
+            source_fps = None
+            try:
+                gif_info = await asyncio.to_thread(_read_gif_info, str(local_gif_path))
+                if gif_info["durations"]:
+                    source_fps = 1000 / min(gif_info["durations"])
+                if frame_dir:
+                    frame_indices = await self._select_frame_indices(
+                        local_gif_path, gif_info
+                    )
+            except SchedulerSaturatedError:
+                raise
+            except Exception as e:
+                # 无法解析帧表时只输出视频，预览帧稍后从视频中抽取
+                logger.debug(f"[{self.PLUGIN_NAME}] 读取 GIF 帧表失败: {e}")
+            try:
+                frames = await self._scheduler.run_async(
+                    lambda: _ffmpeg_gif_to_mp4(
+                        str(local_gif_path),
+                        str(local_mp4_path),
+                        self.ffmpeg_path,
+                        self.ffmpeg_timeout,
+                        frame_dir_str,
+                        frames_key,
+                        frame_indices,
+                        self._frame_options,
+                        self._video_profile,
+                        source_fps,
+                    )
                 )
-
-                if provider_inst:
-                    # 尝试直接获取provider的ID
-                    provider_id = getattr(
-                        provider_inst, "provider_id", None
-                    ) or getattr(provider_inst, "id", None)
-                    logger.info(
-                        f"[{self.PLUGIN_NAME}] 从实例获取到provider_id: {provider_id}"
+                if frames and self.preview_frame_format == "webp":
+                    frames = await self._scheduler.run(
+                        _recode_preview_frames, frames, self._frame_options
                     )
-                    if not provider_id:
-                        # 如果没有id属性，尝试通过实例匹配
-                        provider_id = self._get_provider_id_by_instance(provider_inst)
-                        logger.info(
-                            f"[{self.PLUGIN_NAME}] 通过实例匹配获取到provider_id: {provider_id}"
-                        )
-
-                        # 如果还是无法获取，尝试获取所有providers进行调试
-                        if not provider_id:
-                            try:
-                                # 获取provider_manager的inst_map进行调试
-                                inst_map = getattr(
-                                    self.context.provider_manager, "inst_map", {}
-                                )
-                                logger.info(
-                                    f"[{self.PLUGIN_NAME}] 所有可用的providers: {list(inst_map.keys())}"
-                                )
-                                for pid, p in inst_map.items():
-                                    if p is provider_inst:
-                                        logger.info(
-                                            f"[{self.PLUGIN_NAME}] 找到匹配的provider: {pid}"
-                                        )
-                                        provider_id = pid
-                                        break
-                            except Exception as debug_e:
-                                logger.error(
-                                    f"[{self.PLUGIN_NAME}] 调试获取所有providers失败: {debug_e}"
-                                )
+                return frames
+            except SchedulerSaturatedError:
+                raise
             except Exception as e:
-                logger.error(
-                    f"[{self.PLUGIN_NAME}] 获取provider时出错: {e}", exc_info=True
+                logger.warning(
+                    f"[{self.PLUGIN_NAME}] FFmpeg 直接转换失败，回退到 MoviePy: {e}"
                 )
-
-        if not provider_id:
-            logger.error(f"[{self.PLUGIN_NAME}] 无法获取provider_id，插件将跳过处理")
-            return
-        else:
-            try:
-                setattr(req, "provider_id", provider_id)
-            except Exception:
-                pass
-
-        enabled_provider_id = self.config.get("enabled_provider_id", "")
-        logger.info(
-            f"[{self.PLUGIN_NAME}] 配置的enabled_provider_id: '{enabled_provider_id}'"
-        )
-        logger.info(
-            f"[{self.PLUGIN_NAME}] 当前default_provider_id: '{self.default_provider_id}'"
+                if frame_dir:
+                    await asyncio.to_thread(shutil.rmtree, frame_dir, True)
+
+        return await self._scheduler.run(
+            _blocking_gif_to_mp4,
+            str(local_gif_path),
+            str(local_mp4_path),
+            frame_dir_str,
+            frames_key,
+            self._frame_options if frame_dir else None,
+            self._video_profile,
         )
 
-        is_enabled = False
-        if enabled_provider_id:  # 手动模式
-            is_enabled = provider_id == enabled_provider_id
-            logger.info(
-                f"[{self.PLUGIN_NAME}] 手动模式，检查provider_id: {provider_id} == {enabled_provider_id} = {is_enabled}"
+    async def _select_frame_indices(self, gif_path: Path, gif_info: dict) -> list[int]:
+        """
+        计算 FFmpeg 单次解码时需要输出的预览帧序号。
+        uniform 只读取帧表；scene 需要解码全部帧计算画面差异，经由调度器限流。
+        """
+        if self.frame_selection == "scene":
+            return await self._scheduler.run(
+                _select_keyframes,
+                str(gif_path),
+                self.preview_frame_count,
+                self.scene_change_threshold,
             )
-        else:  # 自动模式
-            if self.default_provider_id is None:
-                self.default_provider_id = self._get_default_provider_id()
-                logger.info(
-                    f"[{self.PLUGIN_NAME}] 重新获取default_provider_id: {self.default_provider_id}"
-                )
-            if self.default_provider_id:
-                is_enabled = provider_id == self.default_provider_id
-                logger.info(
-                    f"[{self.PLUGIN_NAME}] 自动模式，检查provider_id: {provider_id} == {self.default_provider_id} = {is_enabled}"
+        return _sample_frame_indices(gif_info["durations"], self.preview_frame_count)
+
+    async def _convert_gif_content_locked(
+        self,
+        cache_key: str,
+        local_gif_path: Path,
+        local_mp4_path: Path,
+        frames_only: bool,
+    ) -> Path | None:
+        """
+        持有跨实例锁进行转换。共享缓存目录下，其他实例正在转换同一内容时等待其完成，
+        随后 _convert_gif_content 会直接命中对方发布的结果。
+        """
+        async with self._cache.lock(cache_key, self.ffmpeg_timeout or 120):
+            return await self._convert_gif_content(
+                cache_key, local_gif_path, local_mp4_path, frames_only
+            )
+
+    async def _convert_gif_content(
+        self,
+        cache_key: str,
+        local_gif_path: Path,
+        local_mp4_path: Path,
+        frames_only: bool,
+    ) -> Path | None:
+        """
+        将已落地的GIF转换为MP4并写入缓存。相同内容的并发转换由调用方合并。
+        预览帧缺失时在同一次解码中一并生成，无需再次解码输出的 MP4。
+        预览帧模式下只保留源 GIF 并直接抽帧，跳过视频编码。
+        """
+        cached = await self._get_cached_result(cache_key, frames_only)
+        if cached:
+            return cached[1]
+
+        route = self._probe_route(
+            await self._probe_gif(cache_key, local_gif_path), frames_only
+        )
+        if route != self.ROUTE_VIDEO:
+            if frames_only and route == self.ROUTE_FRAMES:
+                # 预览帧模式保留源 GIF，之后需要视频时再按需编码
+                await asyncio.to_thread(
+                    self._cache_source_file, cache_key, local_gif_path
                 )
+                await self._ensure_preview_frames(cache_key, None)
             else:
-                logger.warning(
-                    f"[{self.PLUGIN_NAME}] 无法获取default_provider_id，自动模式失败"
-                )
+                await self._ensure_preview_frames(cache_key, None, local_gif_path)
+            return None
 
-        if not is_enabled:
-            logger.warning(
-                f"[{self.PLUGIN_NAME}] 插件未启用，跳过处理。当前provider: {provider_id}, 配置: {enabled_provider_id}, 默认: {self.default_provider_id}"
+        cached_frames = await self._get_cached_preview_frames(cache_key)
+        # 预览帧先写入本次请求的暂存目录，编码完成后整体发布
+        frame_dir = None if cached_frames else local_mp4_path.parent / "frames"
+        with self._metrics.timed("encode"):
+            frames = await self._encode_gif(
+                local_gif_path, local_mp4_path, frame_dir, cache_key
             )
-            return
-
-        # 3. 执行转换
-        logger.info(f"[{self.PLUGIN_NAME}] 开始处理GIF转换")
-
-        # 确定GIF源
-        gif_source = gif_url if gif_url else gif_file
-        cache_key = self._get_cache_key(gif_source)
+        if frames:
+            await asyncio.to_thread(
+                self._publish_preview_frames,
+                self._frames_key(cache_key),
+                frame_dir,
+                frames,
+            )
+        logger.info(f"[{self.PLUGIN_NAME}] GIF转换成功: {local_mp4_path}")
 
-        # 首先检查缓存
-        video_path = self._get_cached_video_path(gif_source)
-        if not video_path:
-            # 定期清理过期缓存（每次转换前检查一次）
-            self._cleanup_expired_cache()
+        return await asyncio.to_thread(
+            self._cache_video_file, cache_key, local_mp4_path
+        )
 
-            # 创建持久化的临时目录
-            temp_dir = Path(tempfile.mkdtemp(prefix="astrbot_gif_convert_"))
-            local_gif_path = temp_dir / "input.gif"
-            local_mp4_path = temp_dir / "output.mp4"
+    async def _probe_gif(self, cache_key: str, gif_path: Path) -> dict | None:
+        """
+        只读取 GIF 头部与帧表（不解码图像数据），获取帧数、尺寸、时长与文件大小。
+        结果随缓存条目保存，重复命中时无需再次探测。
+        """
+        probe = self._cache.get_probe(cache_key)
+        if probe:
+            return probe
+        try:
+            gif_info = await asyncio.to_thread(_read_gif_info, str(gif_path))
+            size = await asyncio.to_thread(os.path.getsize, gif_path)
+        except Exception as e:
+            # 无法解析时按完整转换处理，由编码器决定成败
+            logger.debug(f"[{self.PLUGIN_NAME}] 探测 GIF 失败: {e}")
+            return None
+        probe = {
+            "frame_count": gif_info["frame_count"],
+            "width": gif_info["width"],
+            "height": gif_info["height"],
+            "duration": gif_info["duration"],
+            "size": size,
+        }
+        await asyncio.to_thread(self._cache.put_probe, cache_key, probe)
+        return probe
+
+    def _probe_route(self, probe: dict | None, frames_only: bool) -> str:
+        """根据探测结果与服务商的转换模式选择处理路径。"""
+        if probe is None:
+            return self.ROUTE_FRAMES if frames_only else self.ROUTE_VIDEO
+        if probe["frame_count"] <= 1:
+            return self.ROUTE_STATIC
+        if frames_only:
+            return self.ROUTE_FRAMES
+        if (self.max_video_gif_bytes and probe["size"] > self.max_video_gif_bytes) or (
+            self.max_video_gif_seconds
+            and probe["duration"] > self.max_video_gif_seconds
+        ):
+            return self.ROUTE_FRAMES
+        return self.ROUTE_VIDEO
+
+    @staticmethod
+    def _mode_key(frames_only: bool) -> str:
+        """单飞键中区分转换模式，只需预览帧的请求不会拿到未编码视频的结果。"""
+        return "frames" if frames_only else "video"
+
+    def _gif_marker(self, route: str) -> str:
+        if route == self.ROUTE_STATIC:
+            # 单帧 GIF 直接作为普通图片附带
+            return "[图片]"
+        return self.VIDEO_MARKER if route == self.ROUTE_VIDEO else self.FRAMES_MARKER
+
+    @staticmethod
+    def _remove_gif_components(event: AstrMessageEvent, components: list):
+        """从消息对象中移除已处理的GIF图片组件"""
+        removed = {id(comp) for comp in components}
+        event.message_obj.message[:] = [
+            comp for comp in event.message_obj.message if id(comp) not in removed
+        ]
+
+    async def _sniff_remote_gif(self, url: str) -> bool:
+        """只请求 URL 开头的几个字节（Range 请求）并检查 GIF 文件头。"""
+        session = self._get_http_session()
+        headers = {"Range": f"bytes=0-{GIF_MAGIC_SIZE - 1}"}
+        # 嗅探使用独立的短超时，图片服务器响应慢时按非 GIF 处理，不拖慢 LLM 请求
+        timeout = aiohttp.ClientTimeout(total=self.GIF_SNIFF_TIMEOUT)
+        async with session.get(url, headers=headers, timeout=timeout) as resp:
+            resp.raise_for_status()
+            # 服务器忽略 Range 时同样只读取开头几个字节，随后直接关闭连接
+            header = b""
+            while len(header) < GIF_MAGIC_SIZE:
+                chunk = await resp.content.read(GIF_MAGIC_SIZE - len(header))
+                if not chunk:
+                    break
+                header += chunk
+        return is_gif_header(header)
 
-            self._register_temp_file(local_gif_path)
-            self._register_temp_file(local_mp4_path)
-            self._register_temp_file(temp_dir)
+    async def _is_gif_source(self, source: str) -> bool:
+        """
+        嗅探文件头判断图片是否为 GIF，判定结果按来源缓存。
+        嗅探失败（网络错误、超时等）时视为非 GIF，且不缓存结果，下次重新嗅探。
+        """
+        verdict = self._gif_verdicts.get(source, "gif")
+        if verdict is not None:
+            return verdict
 
+        async def _sniff() -> bool:
             try:
-                # 下载或复制GIF文件
-                if gif_url and gif_url.startswith(("http://", "https://")):
-                    async with aiohttp.ClientSession() as session:
-                        async with session.get(gif_url) as resp:
-                            resp.raise_for_status()
-                            content = await resp.read()
-                            with open(local_gif_path, "wb") as f:
-                                f.write(content)
-                elif gif_file:
-                    shutil.copy2(gif_file, local_gif_path)
+                if is_remote_source(source):
+                    is_gif = await self._sniff_remote_gif(source)
                 else:
-                    logger.error(f"[{self.PLUGIN_NAME}] 无效的GIF源")
-                    return
-
-                await asyncio.to_thread(
-                    _blocking_gif_to_mp4, str(local_gif_path), str(local_mp4_path)
-                )
-                logger.info(f"[{self.PLUGIN_NAME}] GIF转换成功: {local_mp4_path}")
+                    is_gif = await asyncio.to_thread(sniff_gif_file, source)
+            except Exception as e:
+                logger.debug(f"[{self.PLUGIN_NAME}] 嗅探图片文件头失败 ({source}): {e}")
+                return False
+            self._metrics.inc("gif_sniffs_total", result="gif" if is_gif else "other")
+            self._gif_verdicts.put(
+                source, "gif", is_gif, time.time() + self.GIF_VERDICT_TTL
+            )
+            return is_gif
 
-                video_path = self._cache_video_file(gif_source, local_mp4_path)
+        return await self._single_flight(f"sniff:{source}", _sniff)
 
-            except Exception as e:
-                logger.error(
-                    f"[{self.PLUGIN_NAME}] 处理GIF失败 ({gif_source}): {e}",
-                    exc_info=True,
+    async def _find_gif_components(
+        self, images: list[Comp.Image]
+    ) -> list[tuple[int, Comp.Image, str]]:
+        """
+        按消息顺序找出所有GIF图片组件，返回 (图片序号, 组件, 读取来源)。图片序号对应 prompt 中第几个 [图片]。
+        先按文件名 / URL 判断；无法判断的（如无扩展名的 CDN 链接）并发嗅探文件头。
+        """
+        candidates = []
+        for image_idx, comp in enumerate(images):
+            source = image_source(comp.url, comp.file)
+            if source:
+                candidates.append(
+                    (image_idx, comp, source, guess_gif_by_name(comp.file, comp.url))
                 )
-                return
-            finally:
-                self._cleanup_request_temp_files(
-                    temp_dir, local_gif_path, local_mp4_path
+        ambiguous = [source for *_, source, guess in candidates if guess is None]
+        sniffed: dict[str, bool] = {}
+        if ambiguous:
+            sniffed = dict(
+                zip(
+                    ambiguous,
+                    await asyncio.gather(
+                        *(self._is_gif_source(source) for source in ambiguous)
+                    ),
                 )
+            )
+        return [
+            (image_idx, comp, source)
+            for image_idx, comp, source, guess in candidates
+            if (sniffed[source] if guess is None else guess)
+        ]
+
+    @staticmethod
+    def _replace_image_placeholders(
+        prompt: str, replacements: dict[int, str]
+    ) -> tuple[str, list[int]]:
+        """
+        将 prompt 中第 N 个 [图片] 替换为对应文本，返回新 prompt 与找不到占位符的图片序号。
+        """
+        parts = prompt.split("[图片]")
+        result = parts[0]
+        for idx, part in enumerate(parts[1:]):
+            result += replacements.get(idx, "[图片]") + part
+        missing = [idx for idx in replacements if idx >= len(parts) - 1]
+        return result, missing
+
+    async def _process_gif(self, gif_source: str, frames_only: bool) -> dict | None:
+        """
+        转换单张GIF并获取其预览帧，返回 saturated（是否因繁忙跳过）、cache_key、
+        route（处理路径）与 frames（预览帧）。转换失败时返回 None。
+        frames_only 由服务商路由决定：只支持图片的服务商跳过视频编码。
+        """
+        remote = is_remote_source(gif_source)
+        gif_url = gif_source if remote else None
+        gif_file = None if remote else gif_source
+        # 本地文件的别名键需要 stat，放到线程中计算
+        source_key = await asyncio.to_thread(self._get_source_key, gif_source)
 
-        # 4. 处理视频（发送或分析）
-        if not video_path:
-            return
-
-        # 从消息对象中移除原始的GIF图片组件
-        for i, comp in enumerate(event.message_obj.message):
-            if isinstance(comp, Comp.Image) and (
-                comp.file == gif_file or comp.url == gif_url
-            ):
-                event.message_obj.message.pop(i)
-                break
-
-        # 移除 "[图片]" 文本
-        if hasattr(req, "prompt") and "[图片]" in req.prompt:
-            req.prompt = req.prompt.replace("[图片]", "[视频(GIF已转换)]", 1)
+        # 同一GIF源的并发请求共享一次下载与转换
+        try:
+            result = await self._single_flight(
+                f"source:{source_key}:{self._mode_key(frames_only)}",
+                lambda: self._convert_gif_source(
+                    gif_source, source_key, gif_url, gif_file, frames_only
+                ),
+            )
+        except SchedulerSaturatedError as e:
+            # 转换繁忙时跳过转换，仅移除GIF并在 prompt 中说明，避免服务商报错
+            self._metrics.inc("failures_total", reason="saturated")
+            logger.warning(
+                f"[{self.PLUGIN_NAME}] 转换调度器繁忙，跳过GIF转换: {e}，"
+                f"负载: {self._scheduler.snapshot()}"
+            )
+            return {
+                "saturated": True,
+                "cache_key": None,
+                "route": self._probe_route(None, frames_only),
+                "frames": [],
+            }
+        if not result:
+            return None
+        cache_key, video_path = result
 
         try:
-            preview_frames = await asyncio.to_thread(
-                self._ensure_preview_frames, cache_key, video_path
+            preview_frames = await self._single_flight(
+                f"frames:{cache_key}",
+                lambda: self._ensure_preview_frames(cache_key, video_path),
             )
         except Exception as frame_error:
             logger.error(
@@ -609,25 +1317,383 @@ class GifToVideoPlugin(Star):
                 exc_info=True,
             )
             preview_frames = []
+        return {
+            "saturated": False,
+            "cache_key": cache_key,
+            "route": self._probe_route(self._cache.get_probe(cache_key), frames_only),
+            "frames": preview_frames,
+        }
+
+    @staticmethod
+    def _message_images(event: AstrMessageEvent) -> list[Comp.Image]:
+        return [
+            comp for comp in event.message_obj.message if isinstance(comp, Comp.Image)
+        ]
+
+    def _schedule_prewarm(self, images: list[Comp.Image], frames_only: bool):
+        """
+        在后台预热消息中的 GIF。超出预热预算或调度器已有排队时放弃预热，
+        把转换名额留给 LLM 请求；放弃的 GIF 仍会在 LLM 请求时正常转换。
+        """
+        if (
+            len(self._prewarm_tasks) >= self.prewarm_max_concurrent
+            or self._scheduler.snapshot()["waiting"]
+        ):
+            self._metrics.inc("prewarm_total", result="skipped")
+            return
+        self._metrics.inc("prewarm_total", result="started")
+        task = asyncio.get_running_loop().create_task(
+            self._prewarm(images, frames_only)
+        )
+        self._prewarm_tasks.add(task)
+        task.add_done_callback(self._prewarm_tasks.discard)
+
+    async def _prewarm(self, images: list[Comp.Image], frames_only: bool):
+        """
+        检测并逐张转换 GIF，结果写入缓存。与 LLM 请求共用单飞键，
+        请求到达时若预热仍在进行，会直接等待同一个转换任务。
+        """
+        try:
+            for *_, source in await self._find_gif_components(images):
+                await self._process_gif(source, frames_only)
+        except Exception as e:
+            logger.debug(f"[{self.PLUGIN_NAME}] GIF 预热失败: {e}")
+
+    def _metric_gauges(self) -> dict[str, float]:
+        """瞬时指标：进行中的转换、调度器负载与缓存占用。"""
+        scheduler = self._scheduler.snapshot()
+        cache = self._cache.stats()
+        hot = self._hot_cache.stats()
+        return {
+            "inflight_conversions": len(self._inflight),
+            "prewarm_inflight": len(self._prewarm_tasks),
+            "scheduler_running": scheduler["running"],
+            "scheduler_waiting": scheduler["waiting"],
+            "scheduler_rejected": scheduler["rejected"],
+            "cache_entries": cache["entries"],
+            "cache_bytes": cache["total_bytes"],
+            "cache_added_bytes": cache["added_bytes"],
+            "cache_evictions": cache["evictions"],
+            "hot_cache_entries": hot["entries"],
+        }
+
+    def _format_metrics(self) -> str:
+        """格式化 /gifstats 的输出。"""
+        snapshot = self._metrics.snapshot()
+        lines = [f"GIF 转换插件运行指标（已运行 {snapshot['uptime'] / 3600:.1f} 小时）"]
+        lines.append("阶段耗时（次数 / 平均 / 最大）：")
+        for stage, stat in snapshot["stages"].items():
+            lines.append(
+                f"  {stage}: {stat['count']} / {stat['avg'] * 1000:.1f}ms / "
+                f"{stat['max'] * 1000:.1f}ms"
+            )
+        lines.append("计数：")
+        for name, value in snapshot["counters"].items():
+            lines.append(f"  {name}: {value:g}")
+        lines.append("当前状态：")
+        for name, value in self._metric_gauges().items():
+            lines.append(f"  {name}: {value:g}")
+        return "\n".join(lines)
+
+    async def _write_metrics_file(self):
+        text = self._metrics.render_prometheus(self._metric_gauges())
+        try:
+            await asyncio.to_thread(write_prometheus_file, self.metrics_file, text)
+        except Exception as e:
+            logger.warning(f"[{self.PLUGIN_NAME}] 写入指标文件失败: {e}")
+
+    async def _run_metrics_export(self):
+        """定期将指标写入 Prometheus 文本文件。"""
+        while True:
+            await asyncio.sleep(self.metrics_interval)
+            await self._write_metrics_file()
+
+    def _prepare_storage(self):
+        """创建缓存目录并载入缓存索引（同步文件系统操作，在线程中执行）。"""
+        for directory in (
+            self._local_cache_dir,
+            self._cache_dir,
+            self._frame_cache_dir,
+            self._sheet_cache_dir,
+        ):
+            directory.mkdir(parents=True, exist_ok=True)
+        self._cache.open()
+
+    async def initialize(self):
+        """
+        插件初始化完成后调用。在线程中准备缓存目录与索引、检查 FFmpeg，随后建立服务商路由表。
+        进程池模式下在后台预热转换进程，不计入加载耗时。
+        """
+        started = time.perf_counter()
+        await asyncio.to_thread(self._prepare_storage)
+        # 在插件加载时检查 FFmpeg 是否存在
+        self.ffmpeg_path = await asyncio.to_thread(shutil.which, "ffmpeg")
+        if self.ffmpeg_path is None:
+            logger.error(
+                f"插件 [{self.PLUGIN_NAME}] 加载失败：未在系统中找到核心依赖 FFmpeg。"
+                "GIF 转换功能将无法使用。请参照 README.md 安装 FFmpeg 后重启 AstrBot。"
+            )
+        else:
+            self.ffmpeg_available = True
+            self._build_provider_routes()
+            if self.enabled_provider_ids:
+                logger.info(
+                    f"{self.PLUGIN_NAME} 已加载，运行在【手动模式】，适配服务商: "
+                    f"{', '.join(sorted(self.enabled_provider_ids))}"
+                )
+            else:
+                logger.info(
+                    f"{self.PLUGIN_NAME} 已加载，运行在【自动模式】，默认服务商: {self.default_provider_id}"
+                )
+
+        loop = asyncio.get_running_loop()
+        self._cache.start_maintenance()
+        if self.metrics_file:
+            self._metrics_task = loop.create_task(self._run_metrics_export())
+        self._warm_up_task = loop.create_task(self._scheduler.warm_up())
+
+        load_seconds = self._init_seconds + time.perf_counter() - started
+        self._metrics.observe("load", load_seconds)
+        logger.info(
+            f"[{self.PLUGIN_NAME}] 加载耗时 {load_seconds * 1000:.1f} ms"
+            f"（构造 {self._init_seconds * 1000:.1f} ms，"
+            f"缓存索引 {self._cache.stats()['entries']} 条）"
+        )
+
+    async def terminate(self):
+        """插件终止时调用，释放资源"""
+        logger.info(f"[{self.PLUGIN_NAME}] 插件已终止，清理临时文件")
+        for task in (self._metrics_task, self._warm_up_task):
+            if task and not task.done():
+                task.cancel()
+        for task in list(self._prewarm_tasks):
+            task.cancel()
+        if self.metrics_file:
+            await self._write_metrics_file()
+        self._scheduler.shutdown()
+        if self._http_session is not None and not self._http_session.closed:
+            await self._http_session.close()
+        await self._cache.close()
+        await asyncio.to_thread(self._cleanup_temp_files)
+
+    @filter.permission_type(filter.PermissionType.ADMIN)
+    @filter.command("gifstats")
+    async def gif_stats(self, event: AstrMessageEvent):
+        """查看 GIF 转换插件的运行指标（管理员）"""
+        yield event.plain_result(self._format_metrics())
+
+    @filter.command_group("gifcache")
+    def gifcache(self):
+        """GIF 转换缓存管理"""
+
+    @filter.permission_type(filter.PermissionType.ADMIN)
+    @gifcache.command("export")
+    async def gifcache_export(self, event: AstrMessageEvent):
+        """导出缓存包（索引 + 视频 + 预览帧），供其他实例导入（管理员）"""
+        bundle_path = (
+            self._data_dir
+            / "exports"
+            / f"gif_cache_{time.strftime('%Y%m%d_%H%M%S')}.tar"
+        )
+        try:
+            result = await asyncio.to_thread(self._cache.export_bundle, bundle_path)
+        except Exception as e:
+            logger.error(f"[{self.PLUGIN_NAME}] 导出缓存失败: {e}", exc_info=True)
+            yield event.plain_result(f"导出缓存失败: {e}")
+            return
+        logger.info(f"[{self.PLUGIN_NAME}] 已导出缓存包: {bundle_path}")
+        yield event.plain_result(
+            f"已导出 {result['entries']} 个缓存条目、{result['aliases']} 条别名 "
+            f"({result['bytes'] / 1024**2:.1f} MB)\n{bundle_path}"
+        )
+
+    @filter.permission_type(filter.PermissionType.ADMIN)
+    @gifcache.command("import")
+    async def gifcache_import(self, event: AstrMessageEvent, path: str):
+        """导入缓存包，相对路径按插件数据目录下的 exports 解析（管理员）"""
+        bundle_path = Path(path).expanduser()
+        if not bundle_path.is_absolute():
+            bundle_path = self._data_dir / "exports" / bundle_path
+        try:
+            result = await asyncio.to_thread(self._cache.import_bundle, bundle_path)
+        except Exception as e:
+            logger.error(f"[{self.PLUGIN_NAME}] 导入缓存失败: {e}", exc_info=True)
+            yield event.plain_result(f"导入缓存失败: {e}")
+            return
+        logger.info(f"[{self.PLUGIN_NAME}] 已导入缓存包: {bundle_path}")
+        yield event.plain_result(
+            f"已导入 {result['entries']} 个缓存条目（跳过 {result['skipped']} 个）、"
+            f"{result['aliases']} 条别名"
+        )
+
+    @filter.event_message_type(filter.EventMessageType.ALL)
+    async def prewarm_gif(self, event: AstrMessageEvent):
+        """收到消息时预先在后台转换其中的 GIF，缩短随后 LLM 请求的等待时间"""
+        if not self.prewarm_enabled or not self.ffmpeg_available:
+            return
+        images = self._message_images(event)
+        if not images:
+            return
+        # 只为启用了插件的服务商预热，并按其转换模式生成，保证 LLM 请求能命中
+        route = self._resolve_provider_route(event, None)
+        if route and route["enabled"]:
+            self._schedule_prewarm(images, route["frames_only"])
+
+    @filter.on_llm_request(priority=100)
+    async def handle_gif_message(self, event: AstrMessageEvent, req):
+        """
+        处理包含GIF的消息，将其转换为MP4视频
+        """
+        # 不含图片的消息直接返回，不做任何 I/O，也不输出日志
+        images = self._message_images(event)
+        if not images or not self.ffmpeg_available:
+            return
+
+        # 1. 通过服务商路由表判断插件是否为当前服务商启用，并确定转换模式。
+        # 先于 GIF 检测进行，未启用的服务商不会触发文件头嗅探等网络请求
+        with self._metrics.timed("provider"):
+            route = self._resolve_provider_route(event, req)
+        if not route:
+            logger.debug(f"[{self.PLUGIN_NAME}] 无法获取provider_id，插件将跳过处理")
+            return
+        if not route["enabled"]:
+            logger.debug(
+                f"[{self.PLUGIN_NAME}] 插件未对服务商 {route['provider_id']} 启用，跳过处理"
+            )
+            return
+
+        # 2. 检查消息中是否包含 GIF（按消息顺序收集全部GIF）
+        with self._metrics.timed("detect"):
+            gif_components = await self._find_gif_components(images)
+        if not gif_components:
+            return
+        try:
+            setattr(req, "provider_id", route["provider_id"])
+        except Exception:
+            pass
+
+        # 3. 并发转换消息中的全部GIF，整体耗时约等于最慢的一张
+        logger.info(f"[{self.PLUGIN_NAME}] 开始处理 {len(gif_components)} 张GIF")
+        self._metrics.inc("gifs_total", len(gif_components))
+        with self._metrics.timed("convert"):
+            results = await asyncio.gather(
+                *(
+                    self._process_gif(source, route["frames_only"])
+                    for *_, source in gif_components
+                )
+            )
+
+        # 4. 按消息顺序注入结果，预览帧合计不超过单条消息的上限
+        handled = [
+            (image_idx, comp, result)
+            for (image_idx, comp, _), result in zip(gif_components, results)
+            if result is not None
+        ]
+        if not handled:
+            return
+        # 同一张 GIF 在消息中出现多次时只附带一次预览帧，重复项指向首次出现时附带的图片。
+        # 转换繁忙时没有缓存键，这些条目各自保留
+        first_seen: dict[str | int, int] = {}
+        duplicates: dict[int, int] = {}
+        for pos, (*_, result) in enumerate(handled):
+            first = first_seen.setdefault(result["cache_key"] or pos, pos)
+            if first != pos:
+                duplicates[pos] = first
+        unique = [
+            (pos, result)
+            for pos, (*_, result) in enumerate(handled)
+            if pos not in duplicates
+        ]
+        budgets = dict(
+            zip(
+                (pos for pos, _ in unique),
+                self._allocate_frame_budget(
+                    [len(result["frames"]) for _, result in unique]
+                ),
+            )
+        )
+        picked_frames = {
+            pos: self._pick_frames(result["frames"], budgets[pos])
+            for pos, result in unique
+        }
+
+        # 网格图模式：每张 GIF 只附带一张拼好的图片，减少随请求上传的图片数量
+        sheets: dict[int, Path | None] = dict.fromkeys(picked_frames)
+        if self.preview_output == "contact_sheet":
+            sheets = dict(
+                zip(
+                    picked_frames,
+                    await asyncio.gather(
+                        *(
+                            self._ensure_contact_sheet(
+                                result["cache_key"], picked_frames[pos]
+                            )
+                            if len(picked_frames[pos]) > 1
+                            else asyncio.sleep(0)
+                            for pos, result in unique
+                        )
+                    ),
+                )
+            )
 
         if not hasattr(req, "image_urls") or req.image_urls is None:
             req.image_urls = []
 
-        if preview_frames:
+        multiple = len(unique) > 1
+        replacements: dict[int, str] = {}
+        hints: dict[int, str] = {}
+        total_appended = 0
+        for pos, (image_idx, _, result) in enumerate(handled):
+            if pos in duplicates:
+                first_idx = handled[duplicates[pos]][0]
+                hints[image_idx] = hints[first_idx]
+                replacements[image_idx] = replacements[first_idx]
+                continue
+            budget, picked, sheet = budgets[pos], picked_frames[pos], sheets[pos]
+            first_frame = len(req.image_urls) + 1
             appended = 0
-            for frame_path in preview_frames:
-                path_str = str(frame_path)
+            for image_path in [sheet] if sheet else picked:
+                path_str = str(image_path)
                 if path_str not in req.image_urls:
                     req.image_urls.append(path_str)
                     appended += 1
-            current_prompt = getattr(req, "prompt", "")
-            req.prompt = self._inject_preview_hint(current_prompt, appended)
+            total_appended += appended
+            marker = self._gif_marker(result["route"])
+            if result["route"] == self.ROUTE_STATIC and appended:
+                # 静态 GIF 已作为普通图片附带，无需额外说明
+                hints[image_idx] = ""
+                replacements[image_idx] = marker
+                continue
+            grid = None
+            if sheet and appended:
+                grid = _contact_sheet_layout(len(picked), self.contact_sheet_columns)
+            hints[image_idx] = self._preview_hint(
+                len(picked) if grid else appended,
+                saturated=result["saturated"],
+                first_frame=first_frame if multiple else None,
+                over_budget=bool(result["frames"]) and not budget,
+                grid=grid,
+            )
+            replacements[image_idx] = f"{marker}{hints[image_idx]}"
+
+        # 从消息对象中移除原始的GIF图片组件，并将对应的 "[图片]" 替换为说明
+        self._remove_gif_components(event, [comp for _, comp, _ in handled])
+        prompt, missing = self._replace_image_placeholders(
+            getattr(req, "prompt", "") or "", replacements
+        )
+        # 重复的 GIF 共用同一条说明，未找到占位符时只补充一次
+        extra_hints = "\n".join(
+            dict.fromkeys(hints[idx] for idx in missing if hints[idx])
+        )
+        if extra_hints:
+            prompt = f"{extra_hints}\n{prompt}" if prompt else extra_hints
+        req.prompt = prompt
+
+        if total_appended:
             logger.info(
-                f"[{self.PLUGIN_NAME}] 已注入 {appended} 帧 GIF 预览图片，帮助 LLM 理解动图。"
+                f"[{self.PLUGIN_NAME}] 已注入 {total_appended} 张 GIF 预览图片，帮助 LLM 理解动图。"
             )
-        else:
-            current_prompt = getattr(req, "prompt", "")
-            req.prompt = self._inject_preview_hint(current_prompt, 0)
+        elif not all(result["saturated"] for *_, result in handled):
             logger.warning(
                 f"[{self.PLUGIN_NAME}] 无法生成 GIF 预览帧，仅在 prompt 中记录已转换。"
             )
@@ -0,0 +1,119 @@
+import contextlib
+import os
+import threading
+import time
+from pathlib import Path
+
+# Prometheus 指标名前缀
+METRIC_PREFIX = "gif2video"
+
+
+def _label_str(labels: tuple[tuple[str, str], ...]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in labels) + "}"
+
+
+class Metrics:
+    """
+    插件运行指标。
+    - 计数器：按名称与标签累计（缓存命中/未命中、下载字节数、失败原因等）。
+    - 阶段耗时：每个阶段记录次数、总耗时与最大耗时，用于定位耗时与发现性能回退。
+    只在内存中累计，线程安全；可渲染为 Prometheus 文本格式。
+    """
+
+    def __init__(self):
+        self.started = time.time()
+        # (name, labels) -> value
+        self._counters: dict[tuple[str, tuple[tuple[str, str], ...]], float] = {}
+        # stage -> [count, total_seconds, max_seconds]
+        self._stages: dict[str, list[float]] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name: str, value: float = 1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, stage: str, seconds: float):
+        with self._lock:
+            entry = self._stages.setdefault(stage, [0, 0.0, 0.0])
+            entry[0] += 1
+            entry[1] += seconds
+            entry[2] = max(entry[2], seconds)
+
+    @contextlib.contextmanager
+    def timed(self, stage: str):
+        """记录代码块的耗时（异常退出同样计入）。可包裹含 await 的代码。"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    def snapshot(self) -> dict:
+        """返回当前的计数器与各阶段耗时统计。"""
+        with self._lock:
+            counters = {
+                f"{name}{_label_str(labels)}": value
+                for (name, labels), value in sorted(self._counters.items())
+            }
+            stages = {
+                stage: {
+                    "count": int(count),
+                    "total": total,
+                    "avg": total / count if count else 0.0,
+                    "max": max_seconds,
+                }
+                for stage, (count, total, max_seconds) in sorted(self._stages.items())
+            }
+        return {
+            "uptime": time.time() - self.started,
+            "counters": counters,
+            "stages": stages,
+        }
+
+    def render_prometheus(self, gauges: dict[str, float] | None = None) -> str:
+        """渲染为 Prometheus 文本格式。gauges 为调用方提供的瞬时值（如排队深度）。"""
+        lines = []
+        with self._lock:
+            counters = sorted(self._counters.items())
+            stages = sorted(self._stages.items())
+
+        seen = set()
+        for (name, labels), value in counters:
+            metric = f"{METRIC_PREFIX}_{name}"
+            if metric not in seen:
+                seen.add(metric)
+                lines.append(f"# TYPE {metric} counter")
+            lines.append(f"{metric}{_label_str(labels)} {value:g}")
+
+        if stages:
+            metric = f"{METRIC_PREFIX}_stage_seconds"
+            lines.append(f"# HELP {metric} 各处理阶段耗时")
+            lines.append(f"# TYPE {metric} summary")
+            for stage, (count, total, _) in stages:
+                label = _label_str((("stage", stage),))
+                lines.append(f"{metric}_count{label} {int(count)}")
+                lines.append(f"{metric}_sum{label} {total:.6f}")
+            lines.append(f"# TYPE {metric}_max gauge")
+            for stage, (_, _, max_seconds) in stages:
+                label = _label_str((("stage", stage),))
+                lines.append(f"{metric}_max{label} {max_seconds:.6f}")
+
+        for name, value in sorted((gauges or {}).items()):
+            metric = f"{METRIC_PREFIX}_{name}"
+            lines.append(f"# TYPE {metric} gauge")
+            lines.append(f"{metric} {value:g}")
+        return "\n".join(lines) + "\n"
+
+
+def write_prometheus_file(path: Path, text: str):
+    """原子地写入 Prometheus 文本文件（供 node_exporter textfile collector 读取）。"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    try:
+        tmp_path.write_text(text, encoding="utf-8")
+        os.replace(tmp_path, path)
+    finally:
+        tmp_path.unlink(missing_ok=True)
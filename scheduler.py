@@ -0,0 +1,174 @@
+import asyncio
+import contextlib
+import functools
+import logging
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+logger = logging.getLogger("astrbot")
+
+
+class SchedulerSaturatedError(RuntimeError):
+    """转换调度器已饱和（排队过长或等待超时），调用方应跳过转换。"""
+
+
+class ConversionScheduler:
+    """
+    GIF 转换调度器。
+    - 使用独立的线程池执行编码任务，不占用 AstrBot 的默认执行器。
+    - 可选进程池模式（spawn），让 CPU 密集的编码绕开 GIL，不拖慢事件循环。
+    - 限制同时运行的转换数量，超过排队上限或等待超时时直接拒绝。
+    - 记录排队深度与等待时间，便于观察负载。
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = 2,
+        max_queue_depth: int = 16,
+        wait_timeout: float = 30.0,
+        executor_mode: str = "thread",
+        process_pool_size: int = 0,
+        worker_initializer=None,
+    ):
+        self.max_concurrency = max(1, int(max_concurrency))
+        self.max_queue_depth = max(0, int(max_queue_depth))
+        self.wait_timeout = float(wait_timeout) if wait_timeout else None
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self.process_pool_size = max(0, int(process_pool_size or 0)) or (
+            self.max_concurrency
+        )
+        self._worker_initializer = worker_initializer
+        self.executor_mode = "thread"
+        self._executor = None
+        if executor_mode == "process":
+            self._executor = self._create_process_pool()
+        if self._executor is None:
+            self._executor = self._create_thread_pool()
+        self.running = 0
+        self.waiting = 0
+        self.peak_waiting = 0
+        self.completed = 0
+        self.rejected = 0
+        self.total_wait_time = 0.0
+        self.max_wait_time = 0.0
+
+    def _create_thread_pool(self) -> ThreadPoolExecutor:
+        self.executor_mode = "thread"
+        return ThreadPoolExecutor(
+            max_workers=self.max_concurrency, thread_name_prefix="gif_convert"
+        )
+
+    def _create_process_pool(self) -> ProcessPoolExecutor | None:
+        # 使用 spawn 启动方式，避免 fork 复制事件循环与各类锁的状态
+        try:
+            executor = ProcessPoolExecutor(
+                max_workers=self.process_pool_size,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=self._worker_initializer,
+            )
+        except Exception as e:
+            logger.warning(f"创建 GIF 转换进程池失败，回退到线程池: {e}")
+            return None
+        self.executor_mode = "process"
+        return executor
+
+    async def warm_up(self):
+        """进程池模式下预先启动全部工作进程，避免首个请求承担进程启动开销。"""
+        if self.executor_mode != "process" or self._worker_initializer is None:
+            return
+        loop = asyncio.get_running_loop()
+        try:
+            await asyncio.gather(
+                *(
+                    loop.run_in_executor(self._executor, self._worker_initializer)
+                    for _ in range(self.process_pool_size)
+                )
+            )
+        except Exception as e:
+            logger.warning(f"预热 GIF 转换进程失败，回退到线程池: {e}")
+            self._fallback_to_threads()
+
+    def _fallback_to_threads(self):
+        if self.executor_mode == "thread":
+            return
+        old_executor = self._executor
+        self._executor = self._create_thread_pool()
+        old_executor.shutdown(wait=False, cancel_futures=True)
+
+    @property
+    def queue_depth(self) -> int:
+        """当前排队等待槽位的任务数（不含可立即获得槽位的任务）。"""
+        return max(0, self.running + self.waiting - self.max_concurrency)
+
+    @contextlib.asynccontextmanager
+    async def slot(self):
+        """占用一个转换槽位。排队已满或等待超时时抛出 SchedulerSaturatedError。"""
+        # 正在运行与排队中的任务总数超过 并发数 + 排队上限 时直接拒绝
+        if self.running + self.waiting >= self.max_concurrency + self.max_queue_depth:
+            self.rejected += 1
+            raise SchedulerSaturatedError(
+                f"转换队列已满 (排队 {self.queue_depth}/{self.max_queue_depth})"
+            )
+
+        self.waiting += 1
+        self.peak_waiting = max(self.peak_waiting, self.queue_depth)
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), self.wait_timeout)
+        except TimeoutError:
+            self.rejected += 1
+            raise SchedulerSaturatedError(
+                f"等待转换槽位超时 ({self.wait_timeout}s)"
+            ) from None
+        finally:
+            self.waiting -= 1
+
+        waited = time.perf_counter() - start
+        self.total_wait_time += waited
+        self.max_wait_time = max(self.max_wait_time, waited)
+        self.running += 1
+        try:
+            yield waited
+        finally:
+            self.running -= 1
+            self.completed += 1
+            self._semaphore.release()
+
+    async def run(self, func, *args, **kwargs):
+        """在调度器的执行器中运行阻塞函数。"""
+        async with self.slot():
+            loop = asyncio.get_running_loop()
+            call = functools.partial(func, *args, **kwargs)
+            try:
+                return await loop.run_in_executor(self._executor, call)
+            except BrokenProcessPool as e:
+                # 工作进程异常退出（如被 OOM 终止），回退到线程池后重试一次
+                logger.warning(f"GIF 转换进程池已损坏，回退到线程池: {e}")
+                self._fallback_to_threads()
+                return await loop.run_in_executor(self._executor, call)
+
+    async def run_async(self, factory):
+        """占用一个转换槽位执行协程（如 FFmpeg 子进程），factory 返回待等待的协程。"""
+        async with self.slot():
+            return await factory()
+
+    def snapshot(self) -> dict:
+        """返回当前负载统计。"""
+        started = self.completed + self.running
+        return {
+            "executor_mode": self.executor_mode,
+            "max_concurrency": self.max_concurrency,
+            "max_queue_depth": self.max_queue_depth,
+            "running": self.running,
+            "waiting": self.queue_depth,
+            "peak_waiting": self.peak_waiting,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "avg_wait_time": self.total_wait_time / started if started else 0.0,
+            "max_wait_time": self.max_wait_time,
+        }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
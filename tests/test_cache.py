@@ -0,0 +1,106 @@
+import asyncio
+import sys
+from pathlib import Path
+
+# 插件根目录没有 __init__.py，cache 模块只依赖标准库，可直接导入
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from cache import KIND_VIDEO, CacheManager
+
+
+def _write(path: Path, size: int) -> Path:
+    path.write_bytes(b"\0" * size)
+    return path
+
+
+async def _wait_for_eviction(cache: CacheManager, timeout: float = 5.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while cache.total_bytes > cache.max_bytes:
+        if asyncio.get_running_loop().time() > deadline:
+            break
+        await asyncio.sleep(0.01)
+
+
+def test_add_from_worker_thread_triggers_eviction(tmp_path):
+    """新增条目在工作线程中登记（与插件一致），超出预算后应立即在后台淘汰。"""
+
+    async def scenario():
+        cache = CacheManager(tmp_path, max_bytes=1000)
+        cache.EVICTION_GRACE_SECONDS = 0
+        cache.open()
+        cache.start_maintenance()
+        try:
+            for idx in range(10):
+                path = _write(tmp_path / f"{idx:064x}.mp4", 400)
+                await asyncio.to_thread(cache.add, f"{idx:064x}", KIND_VIDEO, path)
+                await asyncio.sleep(0.01)
+            await _wait_for_eviction(cache)
+            assert cache.evictions > 0
+            assert cache.total_bytes <= cache.max_bytes
+            remaining = [path for path in tmp_path.glob("*.mp4")]
+            assert sum(path.stat().st_size for path in remaining) == cache.total_bytes
+        finally:
+            await cache.close()
+
+    asyncio.run(scenario())
+
+
+def test_eviction_retries_after_grace_period(tmp_path):
+    """超出预算但条目都在访问保护期内时，保护期结束后自动再次淘汰。"""
+
+    async def scenario():
+        cache = CacheManager(tmp_path, max_bytes=1000)
+        cache.EVICTION_GRACE_SECONDS = 0.2
+        cache.open()
+        cache.start_maintenance()
+        try:
+            for idx in range(5):
+                path = _write(tmp_path / f"{idx:064x}.mp4", 400)
+                await asyncio.to_thread(cache.add, f"{idx:064x}", KIND_VIDEO, path)
+            await asyncio.sleep(0.05)
+            assert cache.total_bytes > cache.max_bytes
+            await _wait_for_eviction(cache)
+            assert cache.total_bytes <= cache.max_bytes
+        finally:
+            await cache.close()
+
+    asyncio.run(scenario())
+
+
+def test_shared_mode_only_evicts_owned_entries(tmp_path):
+    """共享模式下登记的其他实例文件只读：不计入预算，也不会被本实例删除。"""
+    shared_dir = tmp_path / "shared"
+    shared_dir.mkdir()
+    index_dir = tmp_path / "local"
+    index_dir.mkdir()
+
+    async def scenario():
+        cache = CacheManager(
+            shared_dir, max_bytes=1000, index_dir=index_dir, shared=True
+        )
+        cache.EVICTION_GRACE_SECONDS = 0
+        cache.open()
+        cache.start_maintenance()
+        try:
+            foreign = [
+                _write(shared_dir / f"{idx:064x}.mp4", 400) for idx in range(100, 105)
+            ]
+            for path in foreign:
+                assert await asyncio.to_thread(cache.adopt, path.stem, KIND_VIDEO, path)
+            assert cache.owned_bytes == 0
+            for idx in range(5):
+                path = _write(shared_dir / f"{idx:064x}.mp4", 400)
+                await asyncio.to_thread(cache.add, f"{idx:064x}", KIND_VIDEO, path)
+                await asyncio.sleep(0.01)
+            deadline = asyncio.get_running_loop().time() + 5
+            while cache.owned_bytes > cache.max_bytes:
+                if asyncio.get_running_loop().time() > deadline:
+                    break
+                await asyncio.sleep(0.01)
+            assert 0 < cache.owned_bytes <= cache.max_bytes
+            assert all(path.exists() for path in foreign)
+            assert all(cache.contains(path.stem, KIND_VIDEO) for path in foreign)
+        finally:
+            await cache.close()
+
+    asyncio.run(scenario())
@@ -0,0 +1,29 @@
+import sys
+from pathlib import Path
+
+import pytest
+from PIL import Image
+
+# 插件根目录没有 __init__.py，converter 模块不依赖 astrbot，可直接导入
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import converter
+
+
+def _write_gif(path: Path, size: tuple[int, int], count: int = 4) -> Path:
+    frames = [Image.new("RGB", size, (idx * 60, 80, 160)) for idx in range(count)]
+    frames[0].save(path, save_all=True, append_images=frames[1:], duration=100, loop=0)
+    return path
+
+
+def test_moviepy_odd_sized_gif_encodes_even_video(tmp_path):
+    """奇数宽高的 GIF 在 yuv420p 下应裁成偶数尺寸后正常编码，而不是输出空文件。"""
+    pytest.importorskip("moviepy")
+    gif_path = _write_gif(tmp_path / "odd.gif", (121, 91))
+    mp4_path = tmp_path / "odd.mp4"
+
+    converter._blocking_gif_to_mp4(str(gif_path), str(mp4_path))
+
+    assert mp4_path.stat().st_size > 0
+    with converter._video_file_clip()(str(mp4_path)) as clip:
+        assert tuple(clip.size) == (120, 90)